@@ -0,0 +1,207 @@
+"""Benchmark a solver on a corpus split into size and difficulty tiers.
+
+A corpus folder holds <size>/<difficulty>/*.csv, the layout the puzzle
+generators save, and each <size>/<difficulty> is one tier. For each tier
+we report the median and p95 solve time, puzzles solved per second and
+the peak memory allocated while solving (tracemalloc, a separate pass so
+it doesn't slow the timed one).
+
+Results can be saved as a baseline json and later runs compared against
+it. A tier that solves fewer puzzles, or whose puzzles per second drops by
+more than the threshold, is a regression. Baselines are per machine, so
+save one before making a change.
+
+The solver modules import their board with sibling imports, so each
+puzzle family runs from its own script, see benchmark_tree_solver.py and
+benchmark_skyscraper_solver.py.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from game_solvers.logger import LOG, set_log_level
+from game_solvers.propagation import PuzzleBoard
+
+# Fraction of a tier's baseline puzzles per second it can lose before failing
+DEFAULT_THRESHOLD = 0.1
+
+
+@dataclass
+class TierResult:
+    """Timings of one size and difficulty tier."""
+    tier: str
+    puzzles: int
+    solved: int
+    median_seconds: float
+    p95_seconds: float
+    puzzles_per_second: float
+    # None if memory wasn't measured
+    peak_memory_bytes: int | None
+
+
+def load_corpus(corpus_path: Path) -> dict[str, list[Path]]:
+    """Return the csv files of each <size>/<difficulty> tier of a corpus folder, smallest size first."""
+    folders = {path.parent for path in corpus_path.glob("*/*/*.csv")}
+    tiers = {}
+    # 10x10 sorts after 9x9 if shorter names come first
+    for folder in sorted(folders, key=lambda folder: (len(folder.parent.name), folder.parent.name, folder.name)):
+        tiers[folder.relative_to(corpus_path).as_posix()] = sorted(folder.glob("*.csv"))
+    return tiers
+
+
+def benchmark_tier(
+    tier: str,
+    read_board: Callable[[Path], PuzzleBoard],
+    solve_board: Callable[[PuzzleBoard], bool],
+    file_paths: list[Path],
+    measure_memory: bool = True,
+) -> TierResult:
+    """Time solving every puzzle of a tier once, reading the boards outside the timer.
+
+    One untimed solve first loads anything cached on first use (line tables...).
+    """
+    solve_board(read_board(file_paths[0]))
+
+    seconds = []
+    solved = 0
+    for file_path in file_paths:
+        board = read_board(file_path)
+        start = time.perf_counter()
+        solved += bool(solve_board(board))
+        seconds.append(time.perf_counter() - start)
+
+    peak_memory = None
+    if measure_memory:
+        peak_memory = 0
+        tracemalloc.start()
+        try:
+            for file_path in file_paths:
+                board = read_board(file_path)
+                tracemalloc.reset_peak()
+                solve_board(board)
+                peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    return TierResult(
+        tier=tier,
+        puzzles=len(file_paths),
+        solved=solved,
+        median_seconds=float(np.median(seconds)),
+        p95_seconds=float(np.percentile(seconds, 95)),
+        puzzles_per_second=len(seconds) / max(sum(seconds), 1e-9),
+        peak_memory_bytes=peak_memory,
+    )
+
+
+def run_benchmarks(
+    read_board: Callable[[Path], PuzzleBoard],
+    solve_board: Callable[[PuzzleBoard], bool],
+    corpus_path: Path,
+    measure_memory: bool = True,
+) -> dict[str, TierResult]:
+    """Benchmark every tier of a corpus folder."""
+    tiers = load_corpus(corpus_path)
+    if not tiers:
+        raise ValueError(f"No <size>/<difficulty>/*.csv puzzles found in {corpus_path}")
+    results = {}
+    for tier, file_paths in tiers.items():
+        print(f"Benchmarking {tier} ({len(file_paths)} puzzles)")
+        results[tier] = benchmark_tier(tier, read_board, solve_board, file_paths, measure_memory)
+    return results
+
+
+def save_baseline(results: dict[str, TierResult], baseline_path: Path) -> None:
+    baseline_path.parent.mkdir(parents=True, exist_ok=True)
+    baseline_path.write_text(json.dumps({tier: asdict(result) for tier, result in results.items()}, indent=2))
+
+
+def load_baseline(baseline_path: Path) -> dict[str, TierResult]:
+    return {tier: TierResult(**result) for tier, result in json.loads(baseline_path.read_text()).items()}
+
+
+def find_regressions(
+    results: dict[str, TierResult], baseline: dict[str, TierResult], threshold: float = DEFAULT_THRESHOLD
+) -> list[str]:
+    """Describe each tier that solved fewer puzzles or got slower by more than threshold.
+
+    A solver that gives up sooner can get faster by solving less, so solved
+    puzzles are checked too. Tiers missing from either side are skipped.
+    """
+    regressions = []
+    for tier, result in results.items():
+        if tier not in baseline:
+            LOG.warning(f"Tier {tier} is not in the baseline, skipping it")
+            continue
+        if result.solved < baseline[tier].solved:
+            regressions.append(f"{tier}: solved {result.solved}/{result.puzzles}, baseline {baseline[tier].solved}")
+        before = baseline[tier].puzzles_per_second
+        if result.puzzles_per_second < before * (1 - threshold):
+            regressions.append(
+                f"{tier}: {result.puzzles_per_second:.1f} puzzles/s, baseline {before:.1f} "
+                f"({result.puzzles_per_second / before - 1:+.1%})"
+            )
+    return regressions
+
+
+def print_results(results: dict[str, TierResult], baseline: dict[str, TierResult] | None = None) -> None:
+    """Print a table of the tiers, with the change in puzzles per second if there is a baseline."""
+    print(f"{'tier':<24} {'puzzles':>7} {'solved':>7} {'median ms':>10} {'p95 ms':>10} {'puzzles/s':>10} {'peak KiB':>10}")
+    for tier, result in results.items():
+        memory = "-" if result.peak_memory_bytes is None else f"{result.peak_memory_bytes / 1024:.0f}"
+        line = (
+            f"{tier:<24} {result.puzzles:>7} {result.solved:>7} {1000 * result.median_seconds:>10.2f} "
+            f"{1000 * result.p95_seconds:>10.2f} {result.puzzles_per_second:>10.1f} {memory:>10}"
+        )
+        if baseline and tier in baseline:
+            line += f" {result.puzzles_per_second / baseline[tier].puzzles_per_second - 1:+.1%}"
+        print(line)
+
+
+def main(
+    description: str,
+    read_board: Callable[[Path], PuzzleBoard],
+    solve_board: Callable[[PuzzleBoard], bool],
+    corpus_path: Path,
+    baseline_path: Path,
+    make_corpus: Callable[[], object],
+) -> int:
+    """Command line entry point of the benchmark scripts, returns the exit code.
+
+    make_corpus generates the corpus if corpus_path has no puzzles.
+    Exits 1 if a tier regressed against the baseline.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--corpus", type=Path, default=corpus_path, help="folder of <size>/<difficulty>/*.csv")
+    parser.add_argument("--baseline", type=Path, default=baseline_path, help="baseline json to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="save these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed drop in puzzles/s")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    args = parser.parse_args()
+
+    # Keep log lines out of the timings
+    set_log_level(LOG, "WARN")
+    if args.corpus == corpus_path and not load_corpus(corpus_path):
+        make_corpus()
+
+    results = run_benchmarks(read_board, solve_board, args.corpus, not args.no_memory)
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print_results(results)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline) if args.baseline.exists() else None
+    print_results(results, baseline)
+    if baseline is None:
+        LOG.warning(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return 0
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    for regression in regressions:
+        LOG.error(f"Throughput regression in {regression}")
+    return 1 if regressions else 0
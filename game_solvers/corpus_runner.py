@@ -0,0 +1,203 @@
+"""Solve a folder of puzzles across a pool of processes.
+
+Each puzzle is read and solved in a worker with its own time limit, and
+the results (solved, wall time and the SolverStats of every rule) are
+written to a json or csv report.
+
+The solver modules import their board with sibling imports, so each
+puzzle family runs from its own script, see test_tree_solver.py and
+test_skyscraper_solver.py.
+"""
+import argparse
+import csv
+import json
+import signal
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field, fields
+from multiprocessing import Pool
+from pathlib import Path
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    TextColumn,
+    TimeElapsedColumn,
+    TimeRemainingColumn,
+)
+from game_solvers.logger import LOG, set_log_level
+from game_solvers.propagation import PuzzleBoard
+from game_solvers.solver_stats import RuleStats, SolverStats
+
+STATUSES = ("solved", "failed", "timeout", "error")
+
+
+class PuzzleTimeout(Exception):
+    """Raised in a worker when a puzzle runs past its time limit."""
+
+
+@dataclass
+class PuzzleResult:
+    """Outcome of solving one puzzle."""
+    name: str
+    # One of STATUSES
+    status: str
+    seconds: float
+    stats: SolverStats = field(default_factory=SolverStats)
+    error: str = ""
+
+    @property
+    def solved(self) -> bool:
+        return self.status == "solved"
+
+
+def solve_file(
+    read_board: Callable[[Path], PuzzleBoard],
+    solve_board: Callable[[PuzzleBoard], bool],
+    file_path: Path,
+    timeout: float | None = None,
+) -> PuzzleResult:
+    """Read and solve one puzzle, giving up after timeout seconds.
+
+    The board's stats are enabled so the result has every rule's stats.
+    The timeout uses a SIGALRM timer so it needs a Unix main thread, which
+    pool workers are. Elsewhere the puzzle runs without one. The previous
+    SIGALRM handler is put back afterwards.
+    """
+    use_timer = timeout is not None and hasattr(signal, "setitimer")
+    if use_timer:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+
+    start = time.perf_counter()
+    stats = SolverStats()
+    try:
+        # The timer is off before leaving the outer try, so a late alarm is still caught
+        try:
+            if use_timer:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            board = read_board(file_path)
+            board.stats = stats
+            status = "solved" if solve_board(board) else "failed"
+            error = ""
+        finally:
+            if use_timer:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except PuzzleTimeout:
+        status, error = "timeout", f"No result after {timeout} seconds"
+    except Exception as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+    finally:
+        if use_timer:
+            signal.signal(signal.SIGALRM, previous_handler)
+    seconds = time.perf_counter() - start
+
+    return PuzzleResult(file_path.name, status, seconds, stats, error)
+
+
+def _raise_timeout(signum, frame) -> None:
+    raise PuzzleTimeout
+
+
+def _solve_task(task: tuple) -> PuzzleResult:
+    """Solve one puzzle in a worker process."""
+    set_log_level(LOG, "WARN")
+    return solve_file(*task)
+
+
+def run_corpus(
+    read_board: Callable[[Path], PuzzleBoard],
+    solve_board: Callable[[PuzzleBoard], bool],
+    file_paths: list[Path],
+    processes: int | None = None,
+    timeout: float | None = 60.0,
+    report_path: Path | None = None,
+) -> list[PuzzleResult]:
+    """Solve every puzzle, spread over processes workers (default one per core).
+
+    read_board and solve_board must be module level functions (or partials
+    of them) so they can be sent to the workers. processes=1 solves in this
+    process, which keeps profilers and debuggers working.
+    Results are in the order of file_paths and written to report_path if given.
+    """
+    tasks = [(read_board, solve_board, file_path, timeout) for file_path in file_paths]
+    progress_bar = Progress(
+        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TextColumn("•"),
+        TimeElapsedColumn(),
+        TextColumn("•"),
+        TimeRemainingColumn(),
+    )
+
+    start = time.perf_counter()
+    with progress_bar as p:
+        progress = p.add_task("Solving...", total=len(tasks))
+        if processes == 1:
+            results = []
+            for task in tasks:
+                results.append(_solve_task(task))
+                p.advance(progress)
+        else:
+            with Pool(processes) as pool:
+                results = []
+                for result in pool.imap(_solve_task, tasks):
+                    results.append(result)
+                    p.advance(progress)
+    seconds = time.perf_counter() - start
+
+    print_summary(results, seconds)
+    if report_path is not None:
+        write_report(results, report_path)
+        LOG.info(f"Report written to {report_path}")
+    return results
+
+
+def print_summary(results: list[PuzzleResult], seconds: float) -> None:
+    """Print the number of puzzles with each status."""
+    total = len(results)
+    print("Results:")
+    print(f"Number of tests ran: {total}")
+    for status in STATUSES:
+        count = sum(result.status == status for result in results)
+        if count or status in ("solved", "failed"):
+            print(f"{status.capitalize()}: {count} ({100 * count / max(total, 1):2f}%)")
+    print()
+    print(f"Tests ran in: {seconds} seconds")
+
+    total_stats = SolverStats()
+    for result in results:
+        total_stats.merge(result.stats)
+    print()
+    print(total_stats.summary())
+
+
+def write_report(results: list[PuzzleResult], report_path: Path) -> None:
+    """Write the results as json, or csv with columns per rule stat, based on the suffix."""
+    if report_path.suffix == ".json":
+        report_path.write_text(json.dumps([asdict(result) for result in results], indent=2))
+        return
+    if report_path.suffix != ".csv":
+        raise ValueError(f"Report type {report_path.suffix} is not recognised, expected .json or .csv")
+
+    rules = sorted({rule for result in results for rule in result.stats.rules})
+    stat_names = [stat.name for stat in fields(RuleStats)]
+    rule_columns = [f"{rule}_{name}" for rule in rules for name in stat_names]
+    with report_path.open("w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "status", "seconds", "nodes", *rule_columns, "error"])
+        for result in results:
+            rule_stats = [asdict(result.stats.rules.get(rule, RuleStats())) for rule in rules]
+            rule_values = [stats[name] for stats in rule_stats for name in stat_names]
+            writer.writerow([result.name, result.status, f"{result.seconds:.6f}", result.stats.nodes, *rule_values, result.error])
+
+
+def parse_args(description: str) -> argparse.Namespace:
+    """Command line options shared by the corpus scripts."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default one per core)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds allowed per puzzle")
+    parser.add_argument("--report", type=Path, default=None, help="write results to this .json or .csv file")
+    parser.add_argument("--mode", default="rules", help="solve_board mode")
+    parser.add_argument("--profile", action="store_true", help="solve in one process under cProfile")
+    return parser.parse_args()
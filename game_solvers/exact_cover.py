@@ -0,0 +1,86 @@
+"""Knuth's Algorithm X for exact cover problems.
+
+Columns are kept as a dict of column -> set of rows and rows as a dict of
+row -> list of columns. Covering and uncovering then remove and restore
+whole sets, the dict equivalent of dancing links.
+
+Primary columns must be covered exactly once. Any other column is secondary
+and is covered at most once.
+"""
+from collections.abc import Hashable, Iterator
+from game_solvers.propagation import _Budget
+
+
+def exact_covers(
+    rows: dict[Hashable, list[Hashable]],
+    primary: set[Hashable],
+    selected: list[Hashable] = (),
+    max_nodes: int | None = None,
+) -> Iterator[list[Hashable]]:
+    """Yield every set of rows covering each primary column once.
+
+    Parameters:
+        rows: Lookup of row -> columns it covers
+        primary: Columns that must be covered
+        selected: Rows that must be part of every solution
+        max_nodes: Raise SearchBudgetExceeded once the search visits more nodes
+    """
+    columns = {column: set() for column in primary}
+    for row, row_columns in rows.items():
+        for column in row_columns:
+            columns.setdefault(column, set()).add(row)
+    uncovered = set(primary)
+
+    solution = []
+    for row in selected:
+        if any(column not in columns or row not in columns[column] for column in rows[row]):
+            # Clashes with another selected row
+            return
+        uncovered.difference_update(rows[row])
+        select(columns, rows, row)
+        solution.append(row)
+
+    yield from _search(columns, rows, uncovered, solution, _Budget(max_nodes, None))
+
+
+def _search(columns: dict, rows: dict, uncovered: set, solution: list, budget: _Budget) -> Iterator[list]:
+    budget.tick()
+    if not uncovered:
+        yield list(solution)
+        return
+
+    # Branch on the primary column with fewest rows
+    column = min(uncovered, key=lambda c: len(columns[c]))
+    for row in list(columns[column]):
+        covered = uncovered.intersection(rows[row])
+        uncovered -= covered
+        removed = select(columns, rows, row)
+        solution.append(row)
+
+        yield from _search(columns, rows, uncovered, solution, budget)
+
+        solution.pop()
+        deselect(columns, rows, row, removed)
+        uncovered |= covered
+
+
+def select(columns: dict, rows: dict, row: Hashable) -> list[set]:
+    """Cover the columns of row, removing every row that clashes with it."""
+    removed = []
+    for column in rows[row]:
+        for clashing_row in columns[column]:
+            for other_column in rows[clashing_row]:
+                if other_column != column:
+                    columns[other_column].remove(clashing_row)
+        removed.append(columns.pop(column))
+    return removed
+
+
+def deselect(columns: dict, rows: dict, row: Hashable, removed: list[set]) -> None:
+    """Undo select, restoring columns in reverse order."""
+    for column in reversed(rows[row]):
+        columns[column] = removed.pop()
+        for clashing_row in columns[column]:
+            for other_column in rows[clashing_row]:
+                if other_column != column:
+                    columns[other_column].add(clashing_row)
@@ -0,0 +1,114 @@
+"""Bipartite matching helpers shared by the solvers.
+
+Left vertices are 0..len(adjacency) - 1 and each adjacency entry is the set of
+right vertices (0..num_right - 1) they connect to.
+"""
+
+
+def maximum_matching(adjacency: list[set[int]], num_right: int) -> list[int | None]:
+    """Return the right vertex matched to each left vertex (None if unmatched).
+
+    Augmenting path (Kuhn's) algorithm, O(V * E).
+    """
+    match_left = [None] * len(adjacency)
+    match_right = [None] * num_right
+
+    def augment(left: int, seen: set[int]) -> bool:
+        for right in adjacency[left]:
+            if right in seen:
+                continue
+            seen.add(right)
+            if match_right[right] is None or augment(match_right[right], seen):
+                match_left[left] = right
+                match_right[right] = left
+                return True
+        return False
+
+    for left in range(len(adjacency)):
+        augment(left, set())
+    return match_left
+
+
+def supported_edges(adjacency: list[set[int]], num_right: int) -> list[set[int]] | None:
+    """Return the edges of each left vertex that are used by some perfect matching.
+
+    None if there is no perfect matching.
+    Edges outside the maximum matching are used by another perfect matching
+    only if both ends are in the same strongly connected component once
+    matched edges point right to left and the rest point left to right.
+    """
+    num_left = len(adjacency)
+    if num_left != num_right:
+        return None
+    match_left = maximum_matching(adjacency, num_right)
+    if any(right is None for right in match_left):
+        return None
+
+    # Nodes 0..num_left - 1 are left, num_left.. are right
+    graph = [
+        [num_left + right for right in adjacency[left] if right != match_left[left]]
+        for left in range(num_left)
+    ] + [[] for _ in range(num_right)]
+    for left, right in enumerate(match_left):
+        graph[num_left + right].append(left)
+
+    component = strongly_connected_components(graph)
+    return [
+        {
+            right for right in adjacency[left]
+            if right == match_left[left] or component[left] == component[num_left + right]
+        }
+        for left in range(num_left)
+    ]
+
+
+def strongly_connected_components(graph: list[list[int]]) -> list[int]:
+    """Return the component id of each node of a directed graph.
+
+    Iterative Tarjan so deep graphs don't hit the recursion limit.
+    """
+    index = [None] * len(graph)
+    lowlink = [0] * len(graph)
+    component = [None] * len(graph)
+    on_stack = [False] * len(graph)
+    stack = []
+    counter = 0
+    num_components = 0
+
+    for root in range(len(graph)):
+        if index[root] is not None:
+            continue
+        work = [(root, 0)]
+        while work:
+            node, edge_idx = work.pop()
+            if edge_idx == 0:
+                index[node] = lowlink[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+
+            recurse = False
+            for i in range(edge_idx, len(graph[node])):
+                child = graph[node][i]
+                if index[child] is None:
+                    work.append((node, i + 1))
+                    work.append((child, 0))
+                    recurse = True
+                    break
+                if on_stack[child]:
+                    lowlink[node] = min(lowlink[node], index[child])
+            if recurse:
+                continue
+
+            if lowlink[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component[member] = num_components
+                    if member == node:
+                        break
+                num_components += 1
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+    return component
@@ -0,0 +1,74 @@
+"""Record the moves a solver makes, to narrate them later.
+
+A move is an event id plus up to MAX_FIELDS ints (coords, unit, value...)
+written into a preallocated int32 buffer. Nothing is formatted until the
+trace is rendered, each event's describe turns its fields into text.
+
+Boards have trace None, and the rules skip recording with a single
+check, so production solves pay nothing. Pass a MoveTrace to solve_board
+to narrate a solve:
+
+    trace = MoveTrace(TREE_MOVES)
+    solve_board(board, trace=trace)
+    trace.print()
+"""
+import numpy as np
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from rich.console import Console
+from rich.markup import escape
+
+MAX_FIELDS = 5
+
+
+@dataclass(frozen=True)
+class MoveEvent:
+    """One kind of move.
+
+    describe gets the MAX_FIELDS fields of a move (unused ones are 0).
+    """
+    name: str
+    describe: Callable[[tuple[int, ...]], str]
+
+
+class MoveTrace:
+    """Moves in the order they were made, including those later undone by a search."""
+    def __init__(self, events: tuple[MoveEvent, ...], capacity: int = 1024):
+        self.events = events
+        # Event id then the fields, one row per move. Doubles when full
+        self.moves = np.zeros((capacity, MAX_FIELDS + 1), dtype=np.int32)
+        self.count = 0
+
+    def record(self, event: int, *fields: int) -> None:
+        if self.count == len(self.moves):
+            self.moves = np.concatenate([self.moves, np.zeros_like(self.moves)])
+        row = self.moves[self.count]
+        row[0] = event
+        row[1:len(fields) + 1] = fields
+        self.count += 1
+
+    def clear(self) -> None:
+        self.count = 0
+        self.moves[:] = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[tuple[MoveEvent, tuple[int, ...]]]:
+        for event, *fields in self.moves[:self.count].tolist():
+            yield self.events[event], tuple(fields)
+
+    def counts(self) -> dict[str, int]:
+        """Number of moves of each event."""
+        ids, counts = np.unique(self.moves[:self.count, 0], return_counts=True)
+        return {self.events[int(i)].name: int(count) for i, count in zip(ids, counts)}
+
+    def render(self) -> list[str]:
+        """Describe every move as text."""
+        return [event.describe(fields) for event, fields in self]
+
+    def print(self, console: Console | None = None) -> None:
+        """Print the moves with rich, numbered and tagged with their event."""
+        console = Console() if console is None else console
+        for number, (event, fields) in enumerate(self, start=1):
+            console.print(f"[dim]{number:>5}[/dim] [bold]{event.name}[/bold] {escape(event.describe(fields))}", highlight=False)
@@ -0,0 +1,249 @@
+"""Constraint propagation and search shared by the puzzle solvers.
+
+A board subclasses PuzzleBoard, which gives it trail based undo and a set of
+the units (rows, columns, shapes...) changed since the solver last looked.
+A puzzle plugs in as a RuleSet:
+
+- Propagators are the rules: rule(board, units) -> bool, whether it changed
+  the board. units are the units changed since the rule last ran.
+- Stages order the propagators. A stage only runs once every stage before
+  it stalls, and any change starts again from the first stage.
+- branches lists the guesses to try when the rules stall.
+"""
+import time
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from typing import Any, Protocol
+from game_solvers.logger import LOG
+from game_solvers.move_trace import MoveTrace
+from game_solvers.solver_stats import SolverStats
+
+
+class SearchBudgetExceeded(Exception):
+    """Raised when a search uses up its node or time budget."""
+
+
+class Trail:
+    """Undo log of board changes.
+
+    Each change is pushed as it happens and rollback hands them back to
+    undo, newest first.
+    """
+    def __init__(self, undo: Callable[[Any], None]):
+        self.entries = []
+        self._undo = undo
+
+    def push(self, entry: Any) -> None:
+        self.entries.append(entry)
+
+    def checkpoint(self) -> int:
+        """Return a marker that rollback can restore to."""
+        return len(self.entries)
+
+    def rollback(self, checkpoint: int) -> None:
+        """Undo every change pushed since the checkpoint was taken."""
+        while len(self.entries) > checkpoint:
+            self._undo(self.entries.pop())
+
+    def clear(self) -> None:
+        self.entries = []
+
+
+class PuzzleBoard:
+    """Undo and change tracking shared by the boards.
+
+    Subclasses provide get_units(), is_valid(), is_full and _undo(entry),
+    and call _mark_dirty(units) whenever a unit changes.
+    """
+    def __init__(self):
+        self.trail = Trail(self._undo)
+        # Units changed since the solver last looked
+        self.dirty_units = set(self.get_units())
+        # Replaced by an enabled SolverStats to record the rules
+        self.stats = SolverStats(enabled=False)
+        # Set to a MoveTrace to record the moves of the rules
+        self.trace: MoveTrace | None = None
+
+    def get_units(self) -> list[Hashable]:
+        raise NotImplementedError
+
+    def is_valid(self) -> bool:
+        raise NotImplementedError
+
+    @property
+    def is_full(self) -> bool:
+        raise NotImplementedError
+
+    def _undo(self, entry: Any) -> None:
+        raise NotImplementedError
+
+    @property
+    def is_solved(self):
+        return self.is_valid() and self.is_full
+
+    @property
+    def is_live(self):
+        return self.is_valid() and not self.is_full
+
+    def _mark_dirty(self, units) -> None:
+        self.dirty_units.update(units)
+
+    def pop_dirty_units(self) -> set[Hashable]:
+        """Return the units changed since the last call and reset them."""
+        dirty_units, self.dirty_units = self.dirty_units, set()
+        return dirty_units
+
+    def checkpoint(self) -> int:
+        """Return a marker that rollback can restore the board to."""
+        return self.trail.checkpoint()
+
+    def rollback(self, checkpoint: int) -> None:
+        """Undo every change made since the checkpoint was taken."""
+        self.trail.rollback(checkpoint)
+
+
+class Propagator(Protocol):
+    """A rule: narrow the board using the given changed units, return whether it changed."""
+    __name__: str
+
+    def __call__(self, board: PuzzleBoard, units: set[Hashable]) -> bool: ...
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    """How a puzzle plugs into propagate and the search."""
+    # Propagators in the order they run, cheap stages first
+    stages: tuple[tuple[Propagator, ...], ...]
+    # Guesses to try when the rules stall, each applies one guess to the board
+    branches: Callable[[PuzzleBoard], list[Callable[[], None]]]
+    # Checks a full board the rules left valid
+    is_solution: Callable[[PuzzleBoard], bool] = lambda board: True
+
+
+def propagate(board: PuzzleBoard, rules: RuleSet) -> bool:
+    """Run the rules until none of them make progress.
+
+    Each stage keeps the units changed since it last ran and is skipped if
+    there are none. Returns whether the board is still valid.
+    With board.stats enabled each rule call is timed, its work is the
+    number of units it was given.
+    """
+    stats = board.stats
+    pending = [set() for _ in rules.stages]
+    while board.is_live:
+        dirty_units = board.pop_dirty_units()
+        for units in pending:
+            units |= dirty_units
+
+        for units, stage in zip(pending, rules.stages):
+            if not units:
+                continue
+            stage_units = set(units)
+            units.clear()
+            # Every rule in the stage runs, then any change restarts from the first stage
+            changed = False
+            for rule in stage:
+                if not stats.enabled:
+                    changed |= rule(board, stage_units)
+                    continue
+                start = time.perf_counter()
+                rule_changed = rule(board, stage_units)
+                stats.record(rule.__name__, rule_changed, time.perf_counter() - start, len(stage_units))
+                changed |= rule_changed
+            if changed:
+                break
+        else:
+            break
+
+    return board.is_valid()
+
+
+class _Budget:
+    """Counts search nodes and stops the search once it runs out."""
+    def __init__(self, max_nodes: int | None, time_limit: float | None):
+        self.max_nodes = max_nodes
+        self.deadline = None if time_limit is None else time.perf_counter() + time_limit
+        self.nodes = 0
+
+    def tick(self) -> None:
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchBudgetExceeded(f"Search stopped after {self.nodes - 1} nodes")
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchBudgetExceeded(f"Search ran out of time after {self.nodes - 1} nodes")
+
+
+def search(board: PuzzleBoard, rules: RuleSet, max_nodes: int | None = None, time_limit: float | None = None) -> bool:
+    """Depth first search using the rules at every node.
+
+    Leaves the board solved and returns True, or restores it and returns
+    False if there is no solution. Raises SearchBudgetExceeded (board
+    restored) if the budget runs out.
+    """
+    budget = _Budget(max_nodes, time_limit)
+
+    def search_node() -> bool:
+        budget.tick()
+        if not propagate(board, rules):
+            return False
+        if board.is_full:
+            return rules.is_solution(board)
+
+        for guess in rules.branches(board):
+            checkpoint = board.checkpoint()
+            guess()
+            if search_node():
+                return True
+            board.rollback(checkpoint)
+        return False
+
+    start = board.checkpoint()
+    try:
+        solved = search_node()
+    except SearchBudgetExceeded:
+        board.rollback(start)
+        raise
+    finally:
+        board.stats.nodes += budget.nodes
+    if not solved:
+        board.rollback(start)
+    LOG.debug(f"Search {'solved' if solved else 'found no solution'} in {budget.nodes} nodes")
+    return solved
+
+
+def count_solutions(
+    board: PuzzleBoard, rules: RuleSet, limit: int = 2, max_nodes: int | None = None, time_limit: float | None = None
+) -> int:
+    """Count the solutions of the board, stopping once limit are found.
+
+    Same search but every branch is tried. The board is left as it was.
+    Raises SearchBudgetExceeded if the budget runs out before the count is known.
+    """
+    budget = _Budget(max_nodes, time_limit)
+    solutions = 0
+
+    def search_node() -> None:
+        nonlocal solutions
+        budget.tick()
+        if not propagate(board, rules):
+            return
+        if board.is_full:
+            solutions += rules.is_solution(board)
+            return
+
+        for guess in rules.branches(board):
+            checkpoint = board.checkpoint()
+            guess()
+            search_node()
+            board.rollback(checkpoint)
+            if solutions >= limit:
+                return
+
+    start = board.checkpoint()
+    try:
+        search_node()
+    finally:
+        board.rollback(start)
+        board.stats.nodes += budget.nodes
+    LOG.debug(f"Found {solutions} solutions (limit {limit}) in {budget.nodes} nodes")
+    return solutions
@@ -0,0 +1,18 @@
+"""Benchmark the skyscraper solver on the generated puzzles by size and difficulty"""
+from skyscraper_solver import read_board, solve_board
+from skyscraper_generator import GENERATED_SKYSCRAPER_PUZZLES_PATH, generate_puzzles
+from functools import partial
+from game_solvers.benchmark import main
+from game_solvers.sporcle_parser import DOWNLOAD_BASE_PATH
+
+BASELINE_PATH = DOWNLOAD_BASE_PATH / "benchmarks" / "skyscraper_solver_baseline.json"
+# Corpus generated if there are no generated puzzles yet
+BENCHMARK_SIZES = [4, 5, 6, 7, 8]
+BENCHMARK_COUNT = 20
+
+
+if __name__ == "__main__":
+    make_corpus = partial(generate_puzzles, BENCHMARK_SIZES, BENCHMARK_COUNT)
+    # Hard puzzles need guesses
+    solve = partial(solve_board, mode="search")
+    exit(main(__doc__, read_board, solve, GENERATED_SKYSCRAPER_PUZZLES_PATH, BASELINE_PATH, make_corpus))
@@ -3,37 +3,38 @@ from pathlib import Path
 from io import StringIO
 import matplotlib.pyplot as plt
 from matplotlib import cm
-from dataclasses import dataclass
-from collections.abc import Iterable
+from game_solvers.propagation import PuzzleBoard
 
 
-@dataclass
-class Square():
-    """Square dataclass."""
-    shape_value: int
-    sub_values: list[int]
-    coords: tuple[int, int]
-
-
-class Board:
+class Board(PuzzleBoard):
     """Board class to handle state and display.
 
     Grid info denoted by 2D Numpy Grid
     Value represents the height of building if game square or the clue if not
+
+    Placed values are held in one int8 array (0 if not placed) and the
+    possible values of each square as a bitmask in one uint32 array
+    (bit value - 1 set if value is possible).
+
+    variant names how the clues score a line, see line_tables.LINE_SCORES.
     """
-    def __init__(self, grid: np.ndarray, file_path: Path):
+    def __init__(self, grid: np.ndarray, file_path: Path, variant: str = "count"):
         rules = grid[:4, :]
         game_grid = grid[4:, :]
 
         self.game_size = game_grid.shape[1]
-        self.board_state = self._generate_board(game_grid)
+        self.values = game_grid.astype(np.int8)
+        self.candidates = self._generate_candidates(game_grid)
         self.visible_buildings = {
             "top_to_bottom": rules[0],
             "left_to_right": rules[1],
             "right_to_left": rules[2],
             "bottom_to_top": rules[3] 
         }
+        self.variant = variant
         self.name = file_path.name
+        # Trail entries are ("value", coords, old value) and ("candidates", index, old masks)
+        super().__init__()
         # TODO: add _validate()
 
     def _is_valid_state(self, state):
@@ -43,17 +44,12 @@ class Board:
         """
         return state
 
-    def _generate_board(self, game_grid: np.ndarray) -> np.ndarray:
-        """Generates an initial board"""
-        board = np.empty(game_grid.shape, dtype=object)
-        board_size = game_grid.shape[1]
-        for i, row in enumerate(game_grid):
-            for j, game_value in enumerate(row):
-                if game_value == 0: 
-                    board[i, j] = Square(0, list(i + 1 for i in range(board_size)), (i, j))
-                else:
-                    board[i, j] = Square(game_value, [game_value], (i, j))
-        return board
+    def _generate_candidates(self, game_grid: np.ndarray) -> np.ndarray:
+        """Generates the initial possible values: all values or the given value"""
+        candidates = np.full(game_grid.shape, (1 << self.game_size) - 1, dtype=np.uint32)
+        given = game_grid > 0
+        candidates[given] = np.left_shift(1, game_grid[given] - 1)
+        return candidates
 
 
     def display(self, solved: bool | None = None):
@@ -91,8 +87,8 @@ class Board:
         # Game tiles
         for i in range(self.game_size):
             for j in range(self.game_size):
-                value = self.board_state[i, j].shape_value
-                sub_values = self.board_state[i, j].sub_values
+                value = int(self.values[i, j])
+                sub_values = self.sub_values((i, j))
                 shape_symbol = str(value) if value else ""
                 shape_colour = colours[value - 1] if value else "white"
                 place_rect(i + 1, j + 1, shape_symbol, sub_values, shape_colour)
@@ -119,20 +115,15 @@ class Board:
 
         plt.show()
 
-    @property
-    def is_live(self):
-        return self.is_valid() and not self.is_full
-    
-    @property
-    def is_solved(self):
-        return self.is_valid() and self.is_full
-    
     @property
     def is_full(self):
-        return not (self.board_values() == 0).any()
+        return not (self.values == 0).any()
     
     def board_values(self) -> np.ndarray:
-        return np.array([[square.shape_value for square in row] for row in self.board_state])
+        """Read only view of the placed values (0 if not placed)."""
+        values = self.values.view()
+        values.flags.writeable = False
+        return values
     
     def is_valid(self) -> bool:
         """Check that the board is still valid.
@@ -140,66 +131,104 @@ class Board:
         1. All rows and columns contain no duplicate values
         2. All squares have at least one possible value
         """
-        def is_group_valid(group: np.ndarray) -> bool:
-            # not more than one value
-            values, counts = np.unique([g.shape_value for g in group], return_counts=True)
-            return all(count <= 1 for value, count in zip(values, counts) if value != 0)
-
-        rows_and_cols = list(self.board_state) + list(self.board_state.T)
-        groups_are_valid = all(is_group_valid(group) for group in rows_and_cols)
+        # placed[i, j, v] is whether square (i, j) holds value v + 1
+        placed = self.values[..., None] == np.arange(1, self.game_size + 1, dtype=np.int8)
+        groups_are_valid = (placed.sum(axis=0) <= 1).all() and (placed.sum(axis=1) <= 1).all()
 
         # Check all squares have possible values
-        have_possible_values = [square.sub_values != [] for square in self.all_squares()]
-        return all(have_possible_values) and groups_are_valid
-    
-    def all_squares(self, active: bool = False) -> Iterable[Square]:
-        """Return all squares in board.
-        
-        active: filters only to squares which are not completed.
-        """
-        for row in self.board_state:
-            for square in row:
-                if active and square.shape_value != 0:
-                    continue
-                yield square
+        return bool((self.candidates != 0).all() and groups_are_valid)
 
     def assign_value(self, coords: tuple, value: int) -> None:
         # assign square
-        square = self.board_state[coords]
-        square.shape_value = value
-        square.sub_values = [value]
+        self.trail.push(("value", coords, self.values[coords]))
+        self.values[coords] = value
 
         # Remove value from all other squares in row and column
-        rows = self.board_state[coords[0], :]
-        cols = self.board_state[:, coords[1]]
-
-        # Use a set to avoid processing the same square twice (i.e., the intersection cell)
-        for update_square in np.concatenate((rows, cols)):
-            if square == update_square:
-                continue
-            sub_vals = update_square.sub_values
-            if value in sub_vals:
-                sub_vals.remove(value)
+        bit = value_bit(value)
+        # Every line crossing a square that loses the value changes
+        self._mark_dirty(("column", int(j)) for j in np.where(self.candidates[coords[0], :] & bit)[0])
+        self._mark_dirty(("row", int(i)) for i in np.where(self.candidates[:, coords[1]] & bit)[0])
+        self._mark_dirty({("row", coords[0]), ("column", coords[1])})
+        self.trail.push(("candidates", (coords[0], slice(None)), self.candidates[coords[0], :].copy()))
+        self.trail.push(("candidates", (slice(None), coords[1]), self.candidates[:, coords[1]].copy()))
+        self.candidates[coords[0], :] &= ~bit
+        self.candidates[:, coords[1]] &= ~bit
+        self.candidates[coords] = bit
+
+    def sub_values(self, coords: tuple) -> list[int]:
+        """Return the possible values of a square."""
+        return mask_values(self.candidates[coords])
+
+    def set_candidates(self, coords: tuple, mask: int) -> None:
+        """Replace the possible values of a square with a bitmask."""
+        if self.candidates[coords] == mask:
+            return
+        self.trail.push(("candidates", coords, self.candidates[coords]))
+        self.candidates[coords] = mask
+        self._mark_dirty({("row", coords[0]), ("column", coords[1])})
+
+    def get_units(self) -> list[tuple[str, int]]:
+        """Return every row and column as (line type, index)."""
+        return [(label, idx) for label in ("row", "column") for idx in range(self.game_size)]
+
+    def _undo(self, entry: tuple[str, tuple, np.ndarray]) -> None:
+        """Put back the value or candidates a trail entry replaced."""
+        kind, index, old = entry
+        if kind == "value":
+            self.values[index] = old
+            return
+        self.candidates[index] = old
+        # index is (row, col) and either may be a full slice
+        for label, idx in zip(("row", "column"), index):
+            idxs = range(self.game_size) if isinstance(idx, slice) else [idx]
+            self._mark_dirty((label, i) for i in idxs)
 
     def get_group(self, direction: str, idx: int) -> np.ndarray:
-        """Return the row/col based on viewing direction and index."""
-        if direction == "top_to_bottom":
-            return self.board_state[:, idx]
-        
-        elif direction == "bottom_to_top":
-            return self.board_state[::-1, idx]
-        
-        elif direction == "left_to_right":
-            return self.board_state[idx, :]
-        
-        elif direction == "right_to_left":
-            return self.board_state[idx, ::-1]
+        """Return the values of the row/col based on viewing direction and index."""
+        return self.values[group_index(direction, idx)]
+
+    def get_group_coords(self, direction: str, idx: int) -> list[tuple[int, int]]:
+        """Return the coords of a row/col in viewing order."""
+        rows, cols = np.indices(self.values.shape)
+        index = group_index(direction, idx)
+        return [(int(i), int(j)) for i, j in zip(rows[index], cols[index])]
+
+    def get_group_candidates(self, direction: str, idx: int) -> np.ndarray:
+        """Return the candidate bitmasks of a row/col in viewing order."""
+        return self.candidates[group_index(direction, idx)]
+
+
+def group_index(direction: str, idx: int) -> tuple:
+    """Return the numpy index of the row/col based on viewing direction and index."""
+    if direction == "top_to_bottom":
+        return (slice(None), idx)
+    
+    elif direction == "bottom_to_top":
+        return (slice(None, None, -1), idx)
+    
+    elif direction == "left_to_right":
+        return (idx, slice(None))
+    
+    elif direction == "right_to_left":
+        return (idx, slice(None, None, -1))
+
+    else:
+        raise ValueError(f"direction {direction} is not recognised.")
+
+
+def value_bit(value: int) -> np.uint32:
+    """Return the candidate bitmask of a single value."""
+    return np.uint32(1 << (int(value) - 1))
+
+
+def mask_values(mask: int) -> list[int]:
+    """Return the values set in a candidate bitmask."""
+    mask = int(mask)
+    return [value + 1 for value in range(mask.bit_length()) if mask >> value & 1]
 
-        else:
-            raise ValueError(f"direction {direction} is not recognised.")
 
-def read_board(file_path: Path) -> Board:
+def read_board(file_path: Path, variant: str = "count") -> Board:
     """Create a Board object from a csv file path"""
     data_txt = file_path.read_text()
     start_grid = np.genfromtxt(StringIO(data_txt), delimiter=",", dtype=int)
-    return Board(start_grid, file_path)
+    return Board(start_grid, file_path, variant)
@@ -0,0 +1,142 @@
+"""Precomputed line tables for the skyscraper solver.
+
+For a grid size N the table holds every permutation of 1..N as candidate
+bitmasks, sorted by the clue seen from the start and then from the end.
+Clues are scored by a LineScore variant (the count of visible buildings or
+the sum of their heights) and each variant gets its own table. Tables are
+saved to disk the first time they are built and memory mapped on later runs.
+"""
+import os
+import numpy as np
+from itertools import permutations
+from functools import cache
+from dataclasses import dataclass
+from pathlib import Path
+from collections.abc import Callable
+from game_solvers.logger import LOG
+from game_solvers.sporcle_parser import DOWNLOAD_BASE_PATH
+
+LINE_TABLES_PATH = DOWNLOAD_BASE_PATH / "line_tables"
+# 9! lines is 362880 rows, 10! would be ten times that
+MAX_TABLE_SIZE = 9
+
+
+@dataclass(frozen=True)
+class LineScore:
+    """How a clue scores the buildings visible from one end of a line.
+
+    The clue is the sum of weight(height) over the visible buildings.
+    weight must be positive and not decrease with height.
+    """
+    name: str
+    weight: Callable
+
+    def max_score(self, size: int) -> int:
+        """Highest clue possible on a line of size (every building visible)."""
+        return int(sum(self.weight(height) for height in range(1, size + 1)))
+
+
+LINE_SCORES = {
+    # Classic skyscrapers: number of buildings seen
+    "count": LineScore("count", lambda heights: (heights > 0) * 1),
+    # Sum skyscrapers: total height of the buildings seen
+    "sum": LineScore("sum", lambda heights: heights),
+}
+
+
+def get_line_score(variant: str) -> LineScore:
+    """Look up a clue variant by name."""
+    if variant not in LINE_SCORES:
+        raise ValueError(f"Unrecognised clue variant: {variant}, expected one of {list(LINE_SCORES)}")
+    return LINE_SCORES[variant]
+
+
+@dataclass(frozen=True)
+class LineTable:
+    """All lines of one size, indexed by the clue seen from each end."""
+    size: int
+    variant: str
+    # One row per line, value v stored as bit v - 1
+    masks: np.ndarray
+    # start * width + end for each line, sorted
+    keys: np.ndarray
+
+    @property
+    def width(self) -> int:
+        return get_line_score(self.variant).max_score(self.size) + 1
+
+    def select(self, start: int, end: int) -> np.ndarray:
+        """Return the lines matching the clues (0 is no clue)."""
+        width = self.width
+        if start and end:
+            lo, hi = np.searchsorted(self.keys, [start * width + end, start * width + end + 1])
+            return self.masks[lo:hi]
+        if start:
+            lo, hi = np.searchsorted(self.keys, [start * width, (start + 1) * width])
+            return self.masks[lo:hi]
+        if end:
+            return self.masks[self.keys % width == end]
+        return self.masks
+
+
+def fit_lines(lines: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """Return the candidates of each square used by one of lines that fits.
+
+    A line fits if every value is a candidate of its square.
+    """
+    fits = lines[((lines & candidates.astype(lines.dtype)) != 0).all(axis=1)]
+    if not len(fits):
+        return np.zeros_like(candidates)
+    return np.bitwise_or.reduce(fits, axis=0).astype(candidates.dtype)
+
+
+@cache
+def get_line_table(size: int, variant: str = "count") -> LineTable:
+    """Load the table for a grid size and clue variant, building and saving it if needed."""
+    get_line_score(variant)
+    masks_path = LINE_TABLES_PATH / f"masks_{variant}_{size}.npy"
+    keys_path = LINE_TABLES_PATH / f"keys_{variant}_{size}.npy"
+    if masks_path.exists() and keys_path.exists():
+        return LineTable(size, variant, np.load(masks_path, mmap_mode="r"), np.load(keys_path, mmap_mode="r"))
+
+    table = build_line_table(size, variant)
+    try:
+        LINE_TABLES_PATH.mkdir(parents=True, exist_ok=True)
+        save_atomic(masks_path, table.masks)
+        save_atomic(keys_path, table.keys)
+    except OSError as e:
+        LOG.warning(f"Could not cache {variant} line table for size {size}: {e}")
+    return table
+
+
+def save_atomic(path: Path, array: np.ndarray) -> None:
+    """Save to a temporary file next to path then rename it over path.
+
+    The rename is atomic, so other processes never load a half written
+    table, even if this save is cut short.
+    """
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+    try:
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def build_line_table(size: int, variant: str = "count") -> LineTable:
+    """Enumerate every line of a grid size and score the buildings seen."""
+    score = get_line_score(variant)
+    lines = np.array(list(permutations(range(1, size + 1))), dtype=np.int8).reshape(-1, size)
+    start = score_visible(lines, score)
+    end = score_visible(lines[:, ::-1], score)
+    keys = (start * (score.max_score(size) + 1) + end).astype(np.int32)
+
+    order = np.argsort(keys, kind="stable")
+    masks = np.left_shift(1, lines[order].astype(np.uint16) - 1).astype(np.uint16)
+    return LineTable(size, variant, masks, keys[order])
+
+
+def score_visible(lines: np.ndarray, score: LineScore) -> np.ndarray:
+    """Clue seen from the start of each line (values distinct)."""
+    visible = lines == np.maximum.accumulate(lines, axis=1)
+    return (visible * score.weight(lines.astype(np.int32))).sum(axis=1)
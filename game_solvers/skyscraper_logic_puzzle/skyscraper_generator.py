@@ -0,0 +1,129 @@
+"""Generate skyscraper puzzles with a unique solution from random latin squares.
+
+1. Build a random latin square a row at a time
+2. Score every line from both ends for the clues
+3. While the clues allow another solution, give away a random square of
+   the latin square (with every clue only small boards are unique)
+4. Remove each clue and given square in a random order unless the puzzle
+   then has another solution
+5. Grade the puzzle by whether the rules alone solve it
+
+Counting stops after COUNT_MAX_NODES search nodes, an unknown count is
+treated as not unique.
+
+Boards are saved as csv in the same layout as the scraped puzzles (4 rows
+of clues then the grid), one folder per size and difficulty. Each board has
+its own seed so a run is reproducible.
+"""
+import numpy as np
+from pathlib import Path
+from board import Board
+from line_tables import get_line_score, score_visible
+from skyscraper_solver import count_solutions, solve_board
+from game_solvers.logger import LOG
+from game_solvers.matching import maximum_matching
+from game_solvers.propagation import SearchBudgetExceeded
+from game_solvers.sporcle_parser import DOWNLOAD_BASE_PATH, save_grid_as_csv
+
+GENERATED_SKYSCRAPER_PUZZLES_PATH = DOWNLOAD_BASE_PATH / "generated_skyscraper_puzzles"
+MIN_SIZE = 4
+MAX_SIZE = 12
+# Search nodes spent on each solution count
+COUNT_MAX_NODES = 2000
+DIFFICULTIES = ("easy", "hard")
+
+
+def generate_board(size: int, rng: np.random.Generator, variant: str = "count") -> np.ndarray:
+    """Return the clue rows stacked on the given squares of a puzzle with exactly one solution."""
+    if not MIN_SIZE <= size <= MAX_SIZE:
+        raise ValueError(f"size {size} is not between {MIN_SIZE} and {MAX_SIZE}.")
+
+    square = latin_square(size, rng)
+    score = get_line_score(variant)
+    # Same order as Board.visible_buildings
+    clues = np.array([
+        score_visible(square.T, score),
+        score_visible(square, score),
+        score_visible(square[:, ::-1], score),
+        score_visible(square.T[:, ::-1], score),
+    ])
+    grid = np.vstack([clues, np.zeros((size, size), dtype=clues.dtype)])
+
+    for flat_idx in rng.permutation(size * size):
+        if is_unique(grid, variant):
+            break
+        i, j = divmod(int(flat_idx), size)
+        grid[4 + i, j] = square[i, j]
+
+    for flat_idx in rng.permutation(grid.size):
+        coords = divmod(int(flat_idx), size)
+        if grid[coords] == 0:
+            continue
+        value = grid[coords]
+        grid[coords] = 0
+        if not is_unique(grid, variant):
+            grid[coords] = value
+    return grid
+
+
+def latin_square(size: int, rng: np.random.Generator) -> np.ndarray:
+    """Random latin square of the values 1..size.
+
+    Each row matches the columns to the values they haven't used yet, with
+    both shuffled so the matching is random. A latin rectangle can always
+    be extended by a row, so the matching is always perfect.
+    """
+    square = np.zeros((size, size), dtype=int)
+    for row in range(size):
+        cols = rng.permutation(size)
+        values = rng.permutation(size) + 1
+        value_ids = {int(value): value_id for value_id, value in enumerate(values)}
+        adjacency = [
+            {value_ids[value] for value in range(1, size + 1) if value not in square[:row, col]}
+            for col in cols
+        ]
+        for col, value_id in zip(cols, maximum_matching(adjacency, size)):
+            square[row, col] = values[value_id]
+    return square
+
+
+def is_unique(grid: np.ndarray, variant: str = "count") -> bool:
+    """Whether the puzzle is known to have exactly one solution."""
+    board = Board(grid, Path("generated.csv"), variant)
+    try:
+        return count_solutions(board, max_nodes=COUNT_MAX_NODES) == 1
+    except SearchBudgetExceeded:
+        return False
+
+
+def grade_board(grid: np.ndarray, variant: str = "count") -> str:
+    """How much of the solver a board needs.
+
+    easy: the rules alone, hard: a search.
+    """
+    board = Board(grid, Path("generated.csv"), variant)
+    return "easy" if solve_board(board) else "hard"
+
+
+def generate_puzzles(sizes: list[int], count: int, seed: int = 0, variant: str = "count") -> dict[str, int]:
+    """Generate count boards of each size and save them as csv.
+
+    Boards are saved to generated_skyscraper_puzzles/<size>x<size>/<difficulty>/.
+    Returns the number of boards saved per difficulty.
+    """
+    saved = dict.fromkeys(DIFFICULTIES, 0)
+    for size in sizes:
+        for index in range(count):
+            rng = np.random.default_rng([seed, size, index])
+            grid = generate_board(size, rng, variant)
+            difficulty = grade_board(grid, variant)
+            folder = GENERATED_SKYSCRAPER_PUZZLES_PATH / f"{size}x{size}" / difficulty
+            folder.mkdir(parents=True, exist_ok=True)
+            save_grid_as_csv(grid, folder.relative_to(DOWNLOAD_BASE_PATH) / f"skyscraper_{size}_{seed}_{index}.csv")
+            saved[difficulty] += 1
+    LOG.info(f"Saved {sum(saved.values())} boards to {GENERATED_SKYSCRAPER_PUZZLES_PATH}: {saved}")
+    return saved
+
+
+if __name__ == "__main__":
+    generate_puzzles(sizes=list(range(MIN_SIZE, MAX_SIZE + 1)), count=100)
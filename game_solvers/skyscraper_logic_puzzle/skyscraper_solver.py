@@ -1,144 +1,378 @@
-from board import read_board, Board, Square
+from board import read_board, mask_values, Board
+from line_tables import fit_lines, get_line_table, get_line_score, MAX_TABLE_SIZE
 import numpy as np
 from game_solvers.logger import LOG
+from game_solvers.matching import supported_edges
 from game_solvers.sporcle_parser import DOWNLOAD_BASE_PATH
-from pathlib import Path
-from itertools import product
+from game_solvers import propagation
+from game_solvers.propagation import RuleSet, SearchBudgetExceeded
+from game_solvers.solver_stats import SolverStats
+from game_solvers.move_trace import MoveEvent, MoveTrace
+from functools import cache, partial
+from collections.abc import Callable
+import time
 
 
 SKYSCRAPER_PUZZLES_PATH = DOWNLOAD_BASE_PATH / "skyscraper_logic_puzzles"
+# Viewing directions from each end of a row/col
+LINE_DIRECTIONS = {
+    "row": ("left_to_right", "right_to_left"),
+    "column": ("top_to_bottom", "bottom_to_top"),
+}
+# Line types as recorded in the move trace
+LINE_TYPES = tuple(LINE_DIRECTIONS)
+# Moves the rules record in board.trace, the event ids follow
+SKYSCRAPER_MOVES = (
+    MoveEvent("one_value", lambda f: f"Square at ({f[0]}, {f[1]}) has only one possible value: {f[2]}"),
+    MoveEvent(
+        "one_square",
+        lambda f: f"In its {LINE_TYPES[f[3]]} the value {f[2]} is only possible in square at ({f[0]}, {f[1]})",
+    ),
+    MoveEvent("no_arrangement", lambda f: f"No arrangement of values fills {LINE_TYPES[f[0]]} {f[1]}"),
+    MoveEvent(
+        "arrangement_narrowed",
+        lambda f: f"Values of {f[2]} squares in {LINE_TYPES[f[0]]} {f[1]} can't be part of any arrangement. Removing them",
+    ),
+    MoveEvent(
+        "clues_narrowed",
+        lambda f: f"Fitting {LINE_TYPES[f[0]]} {f[1]} to rules {f[2]} and {f[3]} narrowed {f[4]} squares",
+    ),
+)
+ONE_VALUE, ONE_SQUARE, NO_ARRANGEMENT, ARRANGEMENT_NARROWED, CLUES_NARROWED = range(len(SKYSCRAPER_MOVES))
 
-def solve_board(board: Board) -> bool:
-    """Main loop to solve the board."""
+def solve_board(
+    board: Board,
+    mode: str = "rules",
+    max_nodes: int = 100_000,
+    time_limit: float = 30.0,
+    stats: SolverStats | None = None,
+    trace: MoveTrace | None = None,
+) -> bool:
+    """Main loop to solve the board.
+
+    mode: "rules" to apply the rules until they stall, "search" to guess
+        values when they do (limited by max_nodes and time_limit seconds)
+    stats: records every rule run on the board (also kept as board.stats)
+    trace: records every move of the rules (also kept as board.trace)
+    """
+    if stats is not None:
+        board.stats = stats
+    if trace is not None:
+        board.trace = trace
     # Rules to run once
     buildings_seen_limits_max_square_value(board)
 
-    while board.is_live:
-        changed = any(
-            [
-                square_has_one_possible_value(board),
-                value_in_group_has_one_possible_square(board),
-            ]
-        )
-        if changed:
-            continue
+    if mode == "search":
+        return search_board(board, max_nodes, time_limit)
+    elif mode != "rules":
+        raise ValueError(f"mode {mode} is not recognised.")
+
+    propagate(board)
+    return board.is_solved and clues_are_met(board)
+
+
+def propagate(board: Board) -> bool:
+    """Apply the rules until none of them make progress.
+
+    Returns whether the board is still valid.
+    """
+    return propagation.propagate(board, SKYSCRAPER_RULES)
 
-        # Last one to try
-        if not if_rule_try_the_options(board):
-            break
 
+def search_board(board: Board, max_nodes: int = 100_000, time_limit: float = 30.0) -> bool:
+    """Depth first search using the rules at every node.
+
+    Guesses each value of the square with fewest possible values, undoing
+    failed guesses with the board trail. If the budget runs out the board is
+    restored and False returned.
+    """
+    try:
+        return propagation.search(board, SKYSCRAPER_RULES, max_nodes, time_limit)
+    except SearchBudgetExceeded as e:
+        LOG.warning(f"{board.name}: {e}")
+        return False
+
+
+def count_solutions(board: Board, limit: int = 2, max_nodes: int = 100_000, time_limit: float = 30.0) -> int:
+    """Count the solutions of the board, stopping once limit are found.
+
+    Same search as search_board but every branch is tried. The board is
+    left as it was. Raises SearchBudgetExceeded if the budget runs out
+    before the count is known.
+    """
+    start = board.checkpoint()
+    try:
+        buildings_seen_limits_max_square_value(board)
+        return propagation.count_solutions(board, SKYSCRAPER_RULES, limit, max_nodes, time_limit)
+    finally:
+        board.rollback(start)
 
-    return board.is_solved
 
+def clues_are_met(board: Board) -> bool:
+    """Check every clue against its line of a full board.
 
-def square_has_one_possible_value(board: Board) -> bool:
-    """If a square only has one possible value, assign it."""
-    # Check all squares
+    if_rule_try_the_options skips complete lines so this is the final check.
+    """
+    for direction, rules in board.visible_buildings.items():
+        for idx, rule in enumerate(rules):
+            if rule and calc_line_score(board.get_group(direction, idx), board.variant) != rule:
+                return False
+    return True
+
+
+def each_value(board: Board) -> list[Callable[[], None]]:
+    """Guesses for the square with fewest possible values: each of its values."""
+    coords = most_constrained_square(board)
+    return [partial(board.assign_value, coords, value) for value in board.sub_values(coords)]
+
+
+def most_constrained_square(board: Board) -> tuple[int, int]:
+    """Return the unassigned square with fewest possible values."""
+    counts = np.where(board.board_values() == 0, np.bitwise_count(board.candidates), board.game_size + 1)
+    return tuple(int(c) for c in np.unravel_index(np.argmin(counts), counts.shape))
+
+
+def square_has_one_possible_value(board: Board, lines: set[tuple[str, int]] | None = None) -> bool:
+    """If a square only has one possible value, assign it.
+
+    Only squares in the given lines are checked (default all).
+    """
+    # Check all squares at once
+    singles = (board.board_values() == 0) & (np.bitwise_count(board.candidates) == 1)
+    if lines is not None:
+        singles &= line_mask(board, lines)
+    trace = board.trace
     updated = False
-    for square in board.all_squares(active=True):
-        sub_values = square.sub_values
-        if len(square.sub_values) == 1:
-            square_coords = square.coords
-            value = sub_values[0]
-            board.assign_value(square_coords, value)
-            LOG.info(f"Square at {square_coords} has only one possible value: {value}")
+    for square_coords in zip(*np.where(singles)):
+        mask = board.candidates[square_coords]
+        if np.bitwise_count(mask) != 1:
+            # Removed by an earlier assignment
+            continue
+        square_coords = tuple(int(c) for c in square_coords)
+        value = int(mask).bit_length()
+        board.assign_value(square_coords, value)
+        if trace is not None:
+            trace.record(ONE_VALUE, *square_coords, value)
+        updated = True
+    return updated
+
+
+def value_in_group_has_one_possible_square(board: Board, lines: set[tuple[str, int]] | None = None) -> bool:
+    """If a value in a row/col can only fit in one square, assign it.
+
+    Only the given lines are checked (default all).
+    """
+    updated = False
+    trace = board.trace
+    values = np.arange(board.game_size, dtype=np.uint32)
+
+    for axis, label in zip([0, 1], ["row", "column"]):
+        # possible[i, j, v] is whether value v + 1 fits square j of row/col i
+        candidates = board.candidates if axis == 0 else board.candidates.T
+        possible = (candidates[..., None] >> values) & 1
+        counts = possible.sum(axis=1)
+        for idx, value_idx in zip(*np.where(counts == 1)):
+            if lines is not None and (label, int(idx)) not in lines:
+                continue
+            pos = int(np.argmax(possible[idx, :, value_idx]))
+            coords = (int(idx), pos) if axis == 0 else (pos, int(idx))
+            value = int(value_idx) + 1
+            if board.values[coords] != 0:
+                # already assigned
+                continue
+            if not board.candidates[coords] >> value_idx & 1:
+                # Removed by an earlier assignment
+                continue
             updated = True
+            board.assign_value(coords, value)
+            if trace is not None:
+                trace.record(ONE_SQUARE, *coords, value, LINE_TYPES.index(label))
+
     return updated
 
 
-def value_in_group_has_one_possible_square(board: Board) -> bool:
-    """If a value in a row/col can only fit in one square, assign it."""
+def value_not_in_any_arrangement(board: Board, lines: set[tuple[str, int]] | None = None) -> bool:
+    """Remove values no arrangement of the row/col can put in a square.
 
-    def has_one_possible_square(group: np.ndarray) -> list[tuple[Square, int]]:
-        """Return (Square, value) pairs where value appears only once in sub_values."""
-        all_values = np.concatenate([sq.sub_values for sq in group])
-        values, counts = np.unique_counts(all_values)
-        return [
-            (square, int(value))
-            for value, count in zip(values, counts)
-            for square in group
-            if count == 1 and value in square.sub_values
-        ]
+    Squares of a row/col are matched to values (each value used once). A value
+    is removed from a square if no perfect matching uses that pair, which finds
+    every naked and hidden pair, triple etc. If there is no perfect matching
+    the row/col can't be filled, so every square loses all its values.
 
+    Only the given lines are checked (default all).
+    """
+    lines = board.get_units() if lines is None else lines
+    trace = board.trace
     updated = False
-    success_log_msg = "In {} {} the value {} is only possible in square at {}."
-
-    for axis, label  in zip([board.board_state, board.board_state.T], ["row", "column"]):
-        for idx, group in enumerate(axis):
-            candidates = has_one_possible_square(group)
-            for square, value in candidates:
-                if square.shape_value != 0:
-                    # already assigned
-                    continue
-                updated = True
-                LOG.info(success_log_msg.format(label, idx, value, square.coords))
-                board.assign_value(square.coords, value)
+    for label, idx in sorted(lines):
+        direction = LINE_DIRECTIONS[label][0]
+        candidates = board.get_group_candidates(direction, idx)
+        adjacency = [{value - 1 for value in mask_values(mask)} for mask in candidates]
+        supported = supported_edges(adjacency, board.game_size)
 
+        if supported is None:
+            options = np.zeros_like(candidates)
+            if trace is not None:
+                trace.record(NO_ARRANGEMENT, LINE_TYPES.index(label), idx)
+        else:
+            options = np.array([sum(1 << value for value in values) for values in supported], dtype=candidates.dtype)
+
+        changed = np.where(options != candidates)[0]
+        if not len(changed):
+            continue
+        group_coords = board.get_group_coords(direction, idx)
+        for id in changed:
+            board.set_candidates(group_coords[id], options[id])
+        updated = True
+        if supported is not None and trace is not None:
+            trace.record(ARRANGEMENT_NARROWED, LINE_TYPES.index(label), idx, len(changed))
     return updated
 
 
-def if_rule_try_the_options(board: Board) -> bool:
-    """If we have a rule and squares available - try all options."""
+def if_rule_try_the_options(board: Board, lines: set[tuple[str, int]] | None = None) -> bool:
+    """If we have a rule and squares available - try all options.
+
+    Each row/col is fitted once against the rules at both of its ends.
+    Only the given lines are fitted (default all).
+    Up to MAX_TABLE_SIZE the lines come from the precomputed line table,
+    larger boards search for them depth first. The table lines checked are
+    added to the rule's work in board.stats.
+    """
+    trace = board.trace
     updated = False
-    for direction, rules in board.visible_buildings.items():
-        for idx, rule in enumerate(rules):
-            if rule == 0:
+    use_table = board.game_size <= MAX_TABLE_SIZE
+    for label, (direction, opposite) in LINE_DIRECTIONS.items():
+        rules = zip(board.visible_buildings[direction], board.visible_buildings[opposite])
+        for idx, (rule, opposite_rule) in enumerate(rules):
+            if rule == 0 and opposite_rule == 0:
                 # 0 represents no rule
                 continue
-            group = board.get_group(direction, idx)
-            unplaced = np.where([g.shape_value == 0 for g in group])[0]
+            if lines is not None and (label, idx) not in lines:
+                continue
+            group_values = board.get_group(direction, idx)
+            unplaced = np.where(group_values == 0)[0]
             if len(unplaced) == 0:
                 # Group is complete
                 continue
-            valid_options = attempt_to_fit_buildings(group, unplaced, rule)
-            
-            for id, option in valid_options.items():
-                square = group[id]
-                if square.sub_values != list(option):
-                    updated = True
-                    # TODO improve this log message (detail)
-                    LOG.info("Updating group with valid options")
-                    square.sub_values = list(option)
+            candidates = board.get_group_candidates(direction, idx)
+            if use_table:
+                arrangements = get_line_table(board.game_size, board.variant).select(rule, opposite_rule)
+                options = fit_lines(arrangements, candidates)
+                board.stats.add_work("if_rule_try_the_options", len(arrangements))
+            else:
+                options = attempt_to_fit_buildings(candidates, rule, opposite_rule, board.variant, board.stats)
+
+            changed = np.where(options != candidates)[0]
+            group_coords = board.get_group_coords(direction, idx)
+            for id in changed:
+                board.set_candidates(group_coords[id], options[id])
+            if len(changed):
+                updated = True
+                if trace is not None:
+                    trace.record(CLUES_NARROWED, LINE_TYPES.index(label), idx, rule, opposite_rule, len(changed))
     return updated
 
 
 
-def attempt_to_fit_buildings(group: np.ndarray, unplaced: np.ndarray, rule: int) -> dict:
-    """Attempt to recursively find a solution for a row.
-    
-    Return a dict of idx -> sub_values.
+def line_mask(board: Board, lines: set[tuple[str, int]]) -> np.ndarray:
+    """Return a boolean grid of the squares in the given lines."""
+    mask = np.zeros(board.candidates.shape, dtype=bool)
+    for label, idx in lines:
+        if label == "row":
+            mask[idx, :] = True
+        else:
+            mask[:, idx] = True
+    return mask
+
+
+def attempt_to_fit_buildings(
+    candidates: np.ndarray, rule: int, opposite_rule: int = 0, variant: str = "count", stats: SolverStats | None = None
+) -> np.ndarray:
+    """Return the candidates of each square used by some line that fits.
+
+    Depth first search carrying the running max and the clue scored from
+    each end, so a branch is dropped as soon as a rule can't be met: too much
+    already seen, or not enough taller values left to see. A placed
+    building stays seen from the end only if it was the tallest value left.
+    Squares still to fill depend only on that state, so each state's union
+    of values is found once instead of listing every line. 0 is no rule.
+    Records its time and the number of states searched in stats if enabled.
     """
-    results = {u: set() for u in unplaced}
-    sub_values = (g.sub_values for g in group[unplaced])
-    all_candidates = product(*sub_values)
-    # Filter out all_candidates with duplicates
-    all_candidates = [sublist for sublist in all_candidates if len(sublist) == len(set(sublist))]
-    
-    for candidate in all_candidates:
-        unplaced_iter = iter(candidate)
-        test_group = [
-            g.shape_value if i not in unplaced else next(unplaced_iter)
-            for i, g in enumerate(group)
-        ]
-        is_valid = (calc_number_buildings_seen(test_group) == rule)
-        if not is_valid:
-            continue
+    start = time.perf_counter() if stats is not None and stats.enabled else None
+    full = [int(mask) for mask in candidates]
+    size = len(full)
+    all_values = (1 << size) - 1
+    # weights[v] is what building v adds to a clue when seen
+    weights = [0] + [int(get_line_score(variant).weight(value)) for value in range(1, size + 1)]
+
+    def most_seen(values: int, count: int) -> int:
+        """Highest score from seeing count of the values (tallest first)."""
+        total = 0
+        while values and count:
+            top = values.bit_length()
+            total += weights[top]
+            values ^= 1 << (top - 1)
+            count -= 1
+        return total
 
-        for i, candidate in enumerate(test_group):
-            if i in results:
-                results[i].add(candidate)
-    return results
+    @cache
+    def search(used: int, highest: int, seen: int, seen_from_end: int) -> tuple[int, ...] | None:
+        pos = used.bit_count()
+        remaining = size - pos
+        unused = all_values & ~used
+        tallest_left = unused.bit_length()
+        if rule:
+            # The tallest value left is seen if it beats the max so far
+            taller = unused >> highest << highest
+            least = seen + (weights[tallest_left] if tallest_left > highest else 0)
+            if not least <= rule <= seen + most_seen(taller, remaining):
+                return None
+        if opposite_rule:
+            least = seen_from_end + weights[tallest_left]
+            if not least <= opposite_rule <= seen_from_end + most_seen(unused, remaining):
+                return None
+        if pos == size:
+            return ()
+
+        options = [0] * remaining
+        values = full[pos] & ~used
+        while values:
+            bit = values & -values
+            values ^= bit
+            value = bit.bit_length()
+            rest = search(
+                used | bit,
+                max(value, highest),
+                seen + (weights[value] if value > highest else 0),
+                seen_from_end + (weights[value] if value == tallest_left else 0),
+            )
+            if rest is None:
+                continue
+            options[0] |= bit
+            for i, mask in enumerate(rest, start=1):
+                options[i] |= mask
+        if not options[0]:
+            return None
+        return tuple(options)
 
+    options = search(0, 0, 0, 0)
+    options = np.zeros_like(candidates) if options is None else np.array(options, dtype=candidates.dtype)
+    if start is not None:
+        progress = bool((options != candidates).any())
+        stats.record("attempt_to_fit_buildings", progress, time.perf_counter() - start, search.cache_info().currsize)
+    return options
 
-def calc_number_buildings_seen(building_group: np.ndarray) -> int:
-    """Calculate the number of buildings seen from the start."""
-    highest_seen = building_group[0]
-    count = 1
-    for building in building_group[1:]:
+
+def calc_line_score(building_group: np.ndarray, variant: str = "count") -> int:
+    """Calculate the clue seen from the start, e.g. the number of buildings seen."""
+    weight = get_line_score(variant).weight
+    highest_seen = 0
+    score = 0
+    for building in building_group:
         if building > highest_seen:
-            count += 1
+            score += int(weight(building))
             highest_seen = building
-    return count
+    return score
 
 def buildings_seen_limits_max_square_value(board: Board) -> None:
     """If x buildings seen then tallest building in square one is 2 + N - r + i
@@ -149,9 +383,11 @@ def buildings_seen_limits_max_square_value(board: Board) -> None:
     E.g.
     If only one building is seen, the first building is the tallest (blocks the rest).
     
-    Run once.
+    Run once. Only holds for count clues, the line fitting covers the other variants.
     """
-    LOG.info("Applying max limits to rows and columns based on the rules")
+    if board.variant != "count":
+        return
+    LOG.debug("Applying max limits to rows and columns based on the rules")
     for direction, rules in board.visible_buildings.items():
         for idx, rule in enumerate(rules):
             if rule == 0:
@@ -159,9 +395,21 @@ def buildings_seen_limits_max_square_value(board: Board) -> None:
                 continue
             max_allowed_value = 1 + board.game_size - rule # + idx
             # Group is in correct direction based on viewing
-            group = board.get_group(direction, idx)
-            for idx, g in enumerate(group):
-                g.sub_values = [s for s in g.sub_values if s <= max_allowed_value + idx]
+            for idx, coords in enumerate(board.get_group_coords(direction, idx)):
+                allowed = (1 << min(max_allowed_value + idx, board.game_size)) - 1
+                board.set_candidates(coords, board.candidates[coords] & allowed)
+
+
+# Each rule only revisits the rows/cols whose candidates changed, fitting
+# lines to the clues is the most expensive so it runs last
+SKYSCRAPER_RULES = RuleSet(
+    stages=(
+        (square_has_one_possible_value, value_in_group_has_one_possible_square, value_not_in_any_arrangement),
+        (if_rule_try_the_options,),
+    ),
+    branches=each_value,
+    is_solution=clues_are_met,
+)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+"""Per rule metrics for the solvers.
+
+Every board carries a SolverStats, disabled unless one is passed to
+solve_board. While disabled, rules skip timing and none are recorded.
+"""
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass
+class RuleStats:
+    """What one rule cost and how often it helped."""
+    calls: int = 0
+    # Calls that changed the board
+    progress: int = 0
+    # Cumulative, a rule that recurses into the solver includes the nested calls
+    seconds: float = 0.0
+    # Rule specific: units scanned, line states searched, squares probed...
+    work: int = 0
+
+    def merge(self, other: "RuleStats") -> None:
+        self.calls += other.calls
+        self.progress += other.progress
+        self.seconds += other.seconds
+        self.work += other.work
+
+
+@dataclass
+class SolverStats:
+    """Stats of every rule run on a board, keyed by rule name."""
+    enabled: bool = True
+    rules: dict[str, RuleStats] = field(default_factory=dict)
+    # Search nodes visited
+    nodes: int = 0
+
+    def record(self, name: str, progress: bool, seconds: float, work: int = 0) -> None:
+        """Record one call of a rule."""
+        if not self.enabled:
+            return
+        rule = self.rules.setdefault(name, RuleStats())
+        rule.calls += 1
+        rule.progress += bool(progress)
+        rule.seconds += seconds
+        rule.work += work
+
+    def add_work(self, name: str, work: int) -> None:
+        """Add work to a rule without counting a call."""
+        if self.enabled:
+            self.rules.setdefault(name, RuleStats()).work += work
+
+    def timed(self, name: str, rule: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call a rule and record it, a truthy result counts as progress."""
+        if not self.enabled:
+            return rule(*args, **kwargs)
+        start = time.perf_counter()
+        result = rule(*args, **kwargs)
+        self.record(name, bool(result), time.perf_counter() - start)
+        return result
+
+    def merge(self, other: "SolverStats") -> None:
+        """Add another board's stats to these, e.g. to total a corpus."""
+        self.nodes += other.nodes
+        for name, rule in other.rules.items():
+            self.rules.setdefault(name, RuleStats()).merge(rule)
+
+    def summary(self) -> str:
+        """Table of the rules, most time first."""
+        lines = [f"{'rule':<40} {'calls':>8} {'progress':>8} {'seconds':>10} {'work':>10}"]
+        for name, rule in sorted(self.rules.items(), key=lambda item: -item[1].seconds):
+            lines.append(f"{name:<40} {rule.calls:>8} {rule.progress:>8} {rule.seconds:>10.4f} {rule.work:>10}")
+        lines.append(f"search nodes: {self.nodes}")
+        return "\n".join(lines)
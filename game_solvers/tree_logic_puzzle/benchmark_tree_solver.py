@@ -0,0 +1,16 @@
+"""Benchmark the tree solver on the generated puzzles by size and difficulty"""
+from tree_solver import read_board, solve_board
+from tree_generator import GENERATED_TREE_PUZZLES_PATH, generate_puzzles
+from functools import partial
+from game_solvers.benchmark import main
+from game_solvers.sporcle_parser import DOWNLOAD_BASE_PATH
+
+BASELINE_PATH = DOWNLOAD_BASE_PATH / "benchmarks" / "tree_solver_baseline.json"
+# Corpus generated if there are no generated puzzles yet
+BENCHMARK_SIZES = [6, 8, 10, 12]
+BENCHMARK_COUNT = 50
+
+
+if __name__ == "__main__":
+    make_corpus = partial(generate_puzzles, BENCHMARK_SIZES, BENCHMARK_COUNT)
+    exit(main(__doc__, read_board, solve_board, GENERATED_TREE_PUZZLES_PATH, BASELINE_PATH, make_corpus))
@@ -4,7 +4,8 @@ from io import StringIO
 import matplotlib.pyplot as plt
 from matplotlib import cm
 from dataclasses import dataclass
-from copy import deepcopy
+from functools import cache
+from game_solvers.propagation import PuzzleBoard
 
 
 DISPLAY_MAP = {
@@ -21,7 +22,25 @@ class Square():
     symbol_id: int = 0
 
 
-class Board:
+@dataclass(frozen=True)
+class BoardIndex:
+    """Lookups fixed once the shapes are known.
+
+    Built once per board and shared (not copied) by copies of the board.
+    """
+    shape_ids: np.ndarray
+    shape_squares: dict[int, tuple[tuple[int, int], ...]]
+    touching_squares: dict[tuple[int, int], tuple[tuple[int, int], ...]]
+    units: tuple[tuple[str, int], ...]
+    unit_masks: dict[tuple[str, int], np.ndarray]
+    # Positions in units of the row, col and shape of each square
+    square_unit_ids: dict[tuple[int, int], tuple[int, int, int]]
+
+    def __deepcopy__(self, memo: dict) -> "BoardIndex":
+        return self
+
+
+class Board(PuzzleBoard):
     """Board class to handle state and display.
 
     Grid info denoted by 3D Numpy Grid
@@ -29,17 +48,25 @@ class Board:
     3rd dimension denotes the Symbol to display [ , T, -]
     Value represents the shapes (int)
 
+    Every row, column and shape holds trees_per_unit trees (1 for the
+    classic puzzle, 2 or more for Star Battle) and no two trees touch.
+
     Add display
         - with coloured grid
         - before and after
         - outlines of shapes
     """
-    def __init__(self, grid: np.ndarray):
+    def __init__(self, grid: np.ndarray, trees_per_unit: int = 1):
 
         board_state = generate_state(grid)
+        self.index = build_index(grid)
+        self.trees_per_unit = trees_per_unit
 
         self.board_state = self._is_valid_state(board_state)
-        self.start_state = deepcopy(self.board_state)
+        self.start_state = generate_state(grid)
+        # Trail entries are (coords, previous symbol_id)
+        super().__init__()
+        self._count_units()
     
     def _is_valid_state(self, state):
         """Check that the state is valid for a tree game
@@ -89,25 +116,73 @@ class Board:
     def place_dash(self, square_coords: tuple) -> None:
         """Placing dash just adds dash."""
         # Dash is 1
-        self.board_state[square_coords].symbol_id = 1
+        self._set_symbol(square_coords, 1)
     
     def place_tree(self, square_coords: tuple) -> None:
-        """Placing tree and dashes where it blocks."""
+        """Placing tree and dashes where it blocks.
+
+        The touching squares and the rest of any row, column or shape that
+        now has all its trees.
+        """
         # T is 2
         square = self.board_state[square_coords]
-        square.symbol_id = 2
-        # Set blocked squares and rest of shape to dash (1)
-        squares_to_dash = self.get_blocked_squares(square) + self.get_squares_of_shape(square.shape_id)
-        deduped_coords = set(square.coords for square in squares_to_dash).difference([square_coords])
-        for coords in deduped_coords:
+        self._set_symbol(square_coords, 2)
+        # Set blocked squares to dash (1)
+        squares_to_dash = self.get_touching_squares(square)
+        for unit_id, unit in zip(self.index.square_unit_ids[square_coords], self.get_square_units(square)):
+            if self.tree_counts[unit_id] >= self.trees_per_unit:
+                squares_to_dash += self.get_unit_squares(unit)
+        for coords in {s.coords for s in squares_to_dash if s.symbol_id == 0}:
             self.place_dash(coords)
- 
+
+    def _set_symbol(self, square_coords: tuple, symbol_id: int) -> None:
+        """Change a square's symbol, recording the old one on the trail."""
+        square = self.board_state[square_coords]
+        if square.symbol_id != symbol_id:
+            self.trail.push((square_coords, square.symbol_id))
+            self._write_symbol(square, symbol_id)
+
+    def _write_symbol(self, square: Square, symbol_id: int) -> None:
+        """Change a square's symbol and keep the unit counters in step."""
+        old_symbol_id = square.symbol_id
+        square.symbol_id = symbol_id
+        self.symbols[square.coords] = symbol_id
+        self._mark_dirty(self.get_square_units(square))
+
+        # 0 is empty, 1 is -, 2 is T
+        self.empty_count += (symbol_id == 0) - (old_symbol_id == 0)
+        for unit_id in self.index.square_unit_ids[square.coords]:
+            was_invalid = self._is_unit_invalid(unit_id)
+            self.tree_counts[unit_id] += (symbol_id == 2) - (old_symbol_id == 2)
+            self.open_counts[unit_id] += (old_symbol_id == 1) - (symbol_id == 1)
+            self.invalid_count += self._is_unit_invalid(unit_id) - was_invalid
+
+    def _is_unit_invalid(self, unit_id: int) -> bool:
+        """A unit is invalid with too many trees or too few squares left for them."""
+        k = self.trees_per_unit
+        return self.tree_counts[unit_id] > k or self.open_counts[unit_id] < k
+
+    def _count_units(self) -> None:
+        """Rebuild the symbols and unit counters from the board state."""
+        self.symbols = np.array([[cell.symbol_id for cell in row] for row in self.board_state])
+        self.empty_count = int((self.symbols == 0).sum())
+        self.tree_counts = [int((self.symbols.ravel()[mask] == 2).sum()) for mask in self.index.unit_masks.values()]
+        self.open_counts = [int((self.symbols.ravel()[mask] != 1).sum()) for mask in self.index.unit_masks.values()]
+        self.invalid_count = sum(self._is_unit_invalid(unit_id) for unit_id in range(len(self.index.units)))
+
+    def _undo(self, entry: tuple[tuple[int, int], int]) -> None:
+        """Put back the symbol a trail entry replaced."""
+        square_coords, symbol_id = entry
+        self._write_symbol(self.board_state[square_coords], symbol_id)
 
     def board_shape_ids(self) -> np.ndarray:
-        return np.array([[cell.shape_id for cell in row] for row in self.board_state])
+        return self.index.shape_ids
     
     def board_symbols(self) -> np.ndarray:
-        return np.array([[cell.symbol_id for cell in row] for row in self.board_state])
+        """Read only view of the symbol ids, kept in step with the squares."""
+        symbols = self.symbols.view()
+        symbols.flags.writeable = False
+        return symbols
     
     def get_squares_with_symbol(self, symbol_id: int) -> list[Square]:
         """Get the squares with given symbol id."""
@@ -117,81 +192,69 @@ class Board:
     
     def get_squares_of_shape(self, shape_id: int) -> list[Square]:
         """Get the squares with given shape id """
-        coords = np.where(self.board_shape_ids() == shape_id)
-        # Warning must be standardised as ints
-        return [self.board_state[coord] for coord in zip(*coords)]
+        return [self.board_state[coord] for coord in self.index.shape_squares[shape_id]]
     
     def get_empty_squares(self) -> list[Square]:
         """Get the coords of squares without symbols"""
         return self.get_squares_with_symbol(0)
     
-    def get_blocked_squares(self, square: Square) -> list[Square]:
-        """Get all squares that are blocked if square is a tree.
-        
-        Full row + Full column + diagonal neighbours
-        """
-        lim_i, lim_j = self.board_state.shape
-        square_coords = square.coords
-        diag_neighbours = [
-            (square_coords[0] + 1, square_coords[1] + 1),
-            (square_coords[0] + 1, square_coords[1] - 1),
-            (square_coords[0] - 1, square_coords[1] + 1),
-            (square_coords[0] - 1, square_coords[1] - 1)
-        ]
-        diag_neighbours = [
-            n for n in diag_neighbours if 
-            0 <= n[0] < lim_i and 0 <= n[1] < lim_j
-        ]
-        row = [(square_coords[0], i) for i in range(lim_i)]
-        col = [(j, square_coords[1]) for j in range(lim_j)]
-        coords = set(row + col + diag_neighbours) - {square_coords}
-        return [self.board_state[coord] for coord in coords]
+    def get_touching_squares(self, square: Square) -> list[Square]:
+        """Get the (up to 8) squares touching square, these can't be trees if it is."""
+        return [self.board_state[coord] for coord in self.index.touching_squares[square.coords]]
     
     def get_groups(self) -> dict:
         """Return dict lookup of group id to group info.
         
         Group info is coords plus symbol
         """
-        result = dict()
-        for i in np.unique(self.board_shape_ids()):
-            squares = self.get_squares_of_shape(i)
-            result[i] = squares
-        return result
+        return {i: self.get_squares_of_shape(i) for i in self.index.shape_squares}
+
+    def get_units(self) -> list[tuple[str, int]]:
+        """Return every row, column and shape as (unit type, index)."""
+        return list(self.index.units)
+
+    def get_unit_squares(self, unit: tuple[str, int]) -> list[Square]:
+        """Return the squares of a (unit type, index) row, column or shape."""
+        unit_type, idx = unit
+        if unit_type == "row":
+            return list(self.board_state[idx, :])
+        elif unit_type == "col":
+            return list(self.board_state[:, idx])
+        elif unit_type == "shape":
+            return self.get_squares_of_shape(idx)
+        else:
+            raise ValueError(f"unit type {unit_type} is not recognised.")
+
+    def get_unit_mask(self, unit: tuple[str, int]) -> np.ndarray:
+        """Return a flat boolean mask of the squares in a unit."""
+        return self.index.unit_masks[unit]
+
+    def get_square_units(self, square: Square) -> tuple[tuple[str, int], ...]:
+        """Return the row, column and shape containing square."""
+        return (("row", square.coords[0]), ("col", square.coords[1]), ("shape", int(square.shape_id)))
     
     def set_board_state(self, board_state: np.ndarray) -> None:
         """Update the board state with a new np.ndarray"""
         # TODO add validate
         self.board_state = board_state
+        self.trail.clear()
+        self.dirty_units = set(self.get_units())
+        self._count_units()
 
     @property
     def num_shapes(self):
-        return len(set(self.board_shape_ids().flatten()))
-    
-    @property
-    def is_solved(self):
-        return self.is_valid() and self.is_full
+        return len(self.index.shape_squares)
     
     @property
     def is_full(self):
-        return not (self.board_symbols() == 0).any()
-    
-    @property
-    def is_live(self):
-        return self.is_valid() and not self.is_full
+        return self.empty_count == 0
     
     def is_valid(self) -> bool:
-        def is_group_valid(group) -> bool:
-            num_trees = sum(g.symbol_id == 2 for g in group)
-            all_dashes = all(g.symbol_id == 1 for g in group)
-            return not all_dashes and num_trees <= 1
-
-        groups_to_check = (
-            list(self.board_state)
-            + list(self.board_state.T)
-            + list(self.get_groups().values())
-        )
-
-        return all(is_group_valid(group) for group in groups_to_check)
+        """Every row, column and shape has at most trees_per_unit trees and room for them.
+
+        Read from counters updated on every symbol change.
+        """
+        return self.invalid_count == 0
     
     @property
     def size(self):
@@ -202,11 +265,92 @@ class Board:
         return len(self.board_state)
 
 
-def read_board(file_path: Path) -> Board:
+def read_board(file_path: Path, trees_per_unit: int = 1) -> Board:
     """Create a Board object from a csv file path"""
     data_txt = file_path.read_text()
     start_grid = np.genfromtxt(StringIO(data_txt), delimiter=",", dtype=int)
-    return Board(start_grid)
+    return Board(start_grid, trees_per_unit)
+
+
+def build_index(grid: np.ndarray) -> BoardIndex:
+    """Build the shape, unit and blocked square lookups for a grid."""
+    shape_ids = np.array(grid, dtype=int)
+    shape_ids.flags.writeable = False
+    size = len(shape_ids)
+
+    shape_squares = {
+        int(shape_id): tuple((int(i), int(j)) for i, j in zip(*np.where(shape_ids == shape_id)))
+        for shape_id in np.unique(shape_ids)
+    }
+    touching_squares = touching_coords(size)
+
+    units = (
+        tuple(("row", i) for i in range(size))
+        + tuple(("col", j) for j in range(size))
+        + tuple(("shape", shape_id) for shape_id in shape_squares)
+    )
+    unit_masks = {}
+    for unit_type, idx in units:
+        mask = np.zeros((size, size), dtype=bool)
+        if unit_type == "row":
+            mask[idx, :] = True
+        elif unit_type == "col":
+            mask[:, idx] = True
+        else:
+            mask = shape_ids == idx
+        mask = mask.ravel()
+        mask.flags.writeable = False
+        unit_masks[(unit_type, idx)] = mask
+
+    unit_ids = {unit: unit_id for unit_id, unit in enumerate(units)}
+    square_unit_ids = {
+        (i, j): (unit_ids[("row", i)], unit_ids[("col", j)], unit_ids[("shape", int(shape_ids[i, j]))])
+        for i in range(size)
+        for j in range(size)
+    }
+
+    return BoardIndex(shape_ids, shape_squares, touching_squares, units, unit_masks, square_unit_ids)
+
+
+@cache
+def blocked_masks(size: int) -> np.ndarray:
+    """Return a (size^2, size^2) mask of the squares each square blocks as a tree.
+
+    Full row + Full column + diagonal neighbours, indexed by flat coords.
+    Built once per board size and read only.
+    """
+    i, j = np.divmod(np.arange(size * size), size)
+    di = np.abs(i[:, None] - i[None, :])
+    dj = np.abs(j[:, None] - j[None, :])
+    masks = (di == 0) | (dj == 0) | ((di == 1) & (dj == 1))
+    np.fill_diagonal(masks, False)
+    masks.flags.writeable = False
+    return masks
+
+
+@cache
+def touching_masks(size: int) -> np.ndarray:
+    """Return a (size^2, size^2) mask of each square and the squares touching it.
+
+    Indexed by flat coords. Built once per board size and read only.
+    """
+    i, j = np.divmod(np.arange(size * size), size)
+    masks = (np.abs(i[:, None] - i[None, :]) <= 1) & (np.abs(j[:, None] - j[None, :]) <= 1)
+    masks.flags.writeable = False
+    return masks
+
+
+@cache
+def touching_coords(size: int) -> dict[tuple[int, int], tuple[tuple[int, int], ...]]:
+    """Return the coords of the squares touching each square.
+
+    Built once per board size and shared, so don't change it.
+    """
+    touching = touching_masks(size)
+    return {
+        divmod(flat_idx, size): tuple(divmod(int(t), size) for t in np.where(touching[flat_idx])[0] if t != flat_idx)
+        for flat_idx in range(size * size)
+    }
 
 
 def generate_state(grid: np.ndarray) -> np.ndarray:
@@ -214,5 +358,5 @@ def generate_state(grid: np.ndarray) -> np.ndarray:
     state = np.empty(grid.shape, dtype=object)
     for i, row in enumerate(grid):
         for j, shape_id in enumerate(row):
-            state[i, j] = Square(shape_id=shape_id, coords=(i, j), symbol_id=0)
+            state[i, j] = Square(shape_id=int(shape_id), coords=(i, j), symbol_id=0)
     return state
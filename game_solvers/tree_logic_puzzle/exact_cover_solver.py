@@ -0,0 +1,67 @@
+"""Solve the tree puzzle as an exact cover problem.
+
+Each square that could hold a tree is a row covering its row, column and
+shape (primary columns: exactly one tree each). No two trees may touch, so
+every 2x2 window of the board is a secondary column (at most one tree each).
+"""
+import numpy as np
+from collections.abc import Iterator
+from board import Board
+from game_solvers.exact_cover import exact_covers
+from game_solvers.logger import LOG
+
+
+def tree_covers(board: Board) -> Iterator[list[tuple[int, int]]]:
+    """Yield the tree coordinates of every solution from the current state.
+
+    Exact cover needs each unit covered once, so one tree per unit only.
+    """
+    if board.trees_per_unit != 1:
+        raise ValueError(f"Exact cover needs 1 tree per unit, not {board.trees_per_unit}.")
+    return shape_covers(board.board_shape_ids(), board.board_symbols())
+
+
+def shape_covers(
+    shape_ids: np.ndarray, symbols: np.ndarray | None = None, max_nodes: int | None = None
+) -> Iterator[list[tuple[int, int]]]:
+    """Yield the tree coordinates of every solution of a grid of shape ids.
+
+    symbols holds any dashes (1) and trees (2) already placed. max_nodes
+    bounds the search, see exact_covers.
+    """
+    size = len(shape_ids)
+    if symbols is None:
+        symbols = np.zeros_like(shape_ids)
+
+    rows = {}
+    for i in range(size):
+        for j in range(size):
+            # 1 is -
+            if symbols[i, j] == 1:
+                continue
+            windows = [
+                ("window", wi, wj)
+                for wi in (i - 1, i)
+                for wj in (j - 1, j)
+                if 0 <= wi < size - 1 and 0 <= wj < size - 1
+            ]
+            rows[(i, j)] = [("row", i), ("col", j), ("shape", int(shape_ids[i, j]))] + windows
+
+    primary = {("row", i) for i in range(size)} | {("col", j) for j in range(size)}
+    primary |= {("shape", int(shape_id)) for shape_id in np.unique(shape_ids)}
+    # 2 is T
+    trees = [(i, j) for i, j in rows if symbols[i, j] == 2]
+    return exact_covers(rows, primary, selected=trees, max_nodes=max_nodes)
+
+
+def solve_board_exact_cover(board: Board) -> bool:
+    """Place the trees of the first exact cover found."""
+    solution = next(tree_covers(board), None)
+    if solution is None:
+        LOG.info("No exact cover exists for the board")
+        return False
+
+    for coords in solution:
+        board.place_tree(coords)
+    LOG.info(f"Exact cover places trees at {sorted(solution)}")
+    return board.is_solved
@@ -1,66 +1,28 @@
 """Test the tree solver against all of the puzzles in the folder"""
 from tree_solver import TREE_PUZZLES_PATH
-from game_solvers.tree_logic_puzzle.tree_solver import read_board, solve_board
-import time
+from tree_solver import read_board, solve_board
+from functools import partial
+from game_solvers.corpus_runner import parse_args, run_corpus
 from game_solvers.logger import set_log_level, LOG
-from rich.progress import (
-    BarColumn,
-    MofNCompleteColumn,
-    Progress,
-    TextColumn,
-    TimeElapsedColumn,
-    TimeRemainingColumn,
-)
 import cProfile
 import pstats
 
 
 set_log_level(LOG, "WARN")
 
-score_count = {
-    "solved": 0,
-    "failed": 0
-}
 
-progress_bar = Progress(
-    TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-    BarColumn(),
-    MofNCompleteColumn(),
-    TextColumn("•"),
-    TimeElapsedColumn(),
-    TextColumn("•"),
-    TimeRemainingColumn(),
-)
-
-def main():
-    start = time.time()
-    with progress_bar as p:
-        task = p.add_task("Solving...", total=len(list(TREE_PUZZLES_PATH.iterdir())))
-
-        for file_path in TREE_PUZZLES_PATH.iterdir():
-            board = read_board(file_path)
-            solved = solve_board(board)
-
-            if solved:
-                score_count["solved"] += 1
-            else:
-                score_count["failed"] += 1
-
-            p.advance(task)
-
-    total_tests = sum(score_count.values())
-    end = time.time()
-
-    print("Results:")
-    print(f"Number of tests ran: {total_tests}")
-    print(f"Solved: {score_count["solved"]} ({100 * score_count["solved"] / total_tests :2f}%)")
-    print(f"Failed: {score_count["failed"]} ({100 * score_count["failed"] / total_tests :2f}%)")
-    print()
-    print(f"Tests ran in: {end - start} seconds")
+def main(processes: int | None = None, timeout: float | None = 60.0, report=None, mode: str = "rules"):
+    file_paths = sorted(TREE_PUZZLES_PATH.iterdir())
+    return run_corpus(read_board, partial(solve_board, mode=mode), file_paths, processes, timeout, report)
 
 
 if __name__ == "__main__":
-    cProfile.run('main()', 'profile_output.prof')
+    args = parse_args(__doc__)
+    if not args.profile:
+        main(args.processes, args.timeout, args.report, args.mode)
+        exit()
+
+    cProfile.run('main(1, args.timeout, args.report, args.mode)', 'profile_output.prof')
 
     p = pstats.Stats('profile_output.prof')
-    p.strip_dirs().sort_stats('cumulative').print_stats(20)
\ No newline at end of file
+    p.strip_dirs().sort_stats('cumulative').print_stats(20)
@@ -0,0 +1,256 @@
+"""Generate tree puzzles with a unique solution.
+
+1. Place one tree per row and column with no two trees touching
+2. Grow a shape out from each tree until every square has a shape
+3. While another solution exists, move one of its trees into a neighbouring
+   shape (that solution now has two trees in one shape, ours is untouched)
+4. Grade the puzzle by how much of the solver it needs
+
+Boards are saved as csv in the same layout as the scraped puzzles, one folder
+per size and difficulty. Each board has its own seed so a run is reproducible
+however the work is split across processes.
+"""
+import numpy as np
+from itertools import islice
+from multiprocessing import Pool
+from board import Board
+from exact_cover_solver import shape_covers
+from tree_solver import CHEAP_RULES, propagate, most_constrained_unit, tree_or_dash
+from game_solvers import propagation
+from game_solvers.propagation import RuleSet, SearchBudgetExceeded
+from game_solvers.logger import LOG
+from game_solvers.sporcle_parser import DOWNLOAD_BASE_PATH, save_grid_as_csv
+
+GENERATED_TREE_PUZZLES_PATH = DOWNLOAD_BASE_PATH / "generated_tree_puzzles"
+MIN_SIZE = 5
+MAX_SIZE = 20
+# Shape moves tried before starting again from new trees
+MAX_REPAIRS = 1000
+# Exact cover nodes tried before checking for other solutions with the rules
+EXACT_COVER_MAX_NODES = 5000
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+DIFFICULTIES = ("easy", "medium", "hard")
+
+
+def generate_board(size: int, rng: np.random.Generator) -> np.ndarray:
+    """Return the shape ids of a board with exactly one solution."""
+    if not MIN_SIZE <= size <= MAX_SIZE:
+        raise ValueError(f"size {size} is not between {MIN_SIZE} and {MAX_SIZE}.")
+
+    while True:
+        trees = place_trees(size, rng)
+        grid = grow_shapes(size, trees, rng)
+        exact_cover = True
+        for _ in range(MAX_REPAIRS):
+            try:
+                other = alternate_solution(grid, trees, exact_cover)
+            except SearchBudgetExceeded:
+                # Once exact cover blows up on a board it keeps doing so
+                exact_cover = False
+                other = alternate_solution(grid, trees, exact_cover)
+            if other is None:
+                return grid
+            if not move_to_neighbour_shape(grid, other - set(trees), trees, rng):
+                break
+
+
+def place_trees(size: int, rng: np.random.Generator) -> list[tuple[int, int]]:
+    """Place one tree in each row and column with no trees touching.
+
+    Random depth first search over the column of each row.
+    """
+    cols = []
+
+    def place(row: int) -> bool:
+        if row == size:
+            return True
+        for col in rng.permutation(size):
+            col = int(col)
+            if col in cols or (cols and abs(cols[-1] - col) < 2):
+                continue
+            cols.append(col)
+            if place(row + 1):
+                return True
+            cols.pop()
+        return False
+
+    place(0)
+    return list(enumerate(cols))
+
+
+def grow_shapes(size: int, trees: list[tuple[int, int]], rng: np.random.Generator) -> np.ndarray:
+    """Grow a shape from each tree, one random square at a time."""
+    grid = np.full((size, size), -1, dtype=int)
+    frontier = []
+    for shape_id, coords in enumerate(trees):
+        grid[coords] = shape_id
+        frontier.append(coords)
+
+    while frontier:
+        # Swap a random square to the end so the pop is O(1)
+        idx = int(rng.integers(len(frontier)))
+        frontier[idx], frontier[-1] = frontier[-1], frontier[idx]
+        i, j = frontier[-1]
+        free = [
+            (i + di, j + dj) for di, dj in NEIGHBOURS
+            if 0 <= i + di < size and 0 <= j + dj < size and grid[i + di, j + dj] == -1
+        ]
+        if not free:
+            frontier.pop()
+            continue
+        coords = free[int(rng.integers(len(free)))]
+        grid[coords] = grid[i, j]
+        frontier.append(coords)
+    return grid
+
+
+def alternate_solution(
+    grid: np.ndarray, trees: list[tuple[int, int]], exact_cover: bool = True
+) -> set[tuple[int, int]] | None:
+    """Return the trees of a solution other than trees, None if it is unique.
+
+    Exact cover is quickest on most boards but its search blows up on some,
+    where the solver's rules prune far more per node. It raises
+    SearchBudgetExceeded after EXACT_COVER_MAX_NODES so the rules can take over.
+    """
+    trees = set(trees)
+    if not exact_cover:
+        return search_other_solution(Board(grid), trees)
+    for solution in islice(shape_covers(grid, max_nodes=EXACT_COVER_MAX_NODES), 2):
+        if set(solution) != trees:
+            return set(solution)
+    return None
+
+
+def search_other_solution(board: Board, trees: set[tuple[int, int]]) -> set[tuple[int, int]] | None:
+    """Depth first search with the solver's rules for a solution other than trees.
+
+    Squares that aren't in trees are tried first.
+    """
+    if not propagate(board):
+        return None
+    if board.is_full:
+        solution = {(int(i), int(j)) for i, j in zip(*np.where(board.board_symbols() == 2))}
+        return solution if solution != trees else None
+
+    for coords in sorted(most_constrained_unit(board), key=lambda c: c in trees):
+        checkpoint = board.checkpoint()
+        board.place_tree(coords)
+        solution = search_other_solution(board, trees)
+        board.rollback(checkpoint)
+        if solution is not None:
+            return solution
+    return None
+
+
+def move_to_neighbour_shape(
+    grid: np.ndarray, squares: set[tuple[int, int]], trees: list[tuple[int, int]], rng: np.random.Generator
+) -> bool:
+    """Move one of squares into a neighbouring shape.
+
+    A square inside its shape takes the shortest path to the edge of the
+    shape with it, and any part of the shape the path cuts off from the
+    shape's tree goes too. Shape i is the shape of trees[i] and trees never
+    move. Returns whether a move was made.
+    """
+    squares = sorted(squares)
+    for idx in rng.permutation(len(squares)):
+        found = path_to_edge(grid, squares[idx], set(trees), rng)
+        if found is None:
+            continue
+        path, neighbour = found
+        shape_id = grid[squares[idx]]
+        for coords in path:
+            grid[coords] = grid[neighbour]
+        kept = np.zeros_like(grid, dtype=bool)
+        kept[tuple(zip(*connected_squares(grid, trees[shape_id])))] = True
+        grid[(grid == shape_id) & ~kept] = grid[neighbour]
+        return True
+    return False
+
+
+def path_to_edge(
+    grid: np.ndarray, start: tuple[int, int], fixed: set[tuple[int, int]], rng: np.random.Generator
+) -> tuple[list[tuple[int, int]], tuple[int, int]] | None:
+    """Shortest path within start's shape to a square touching another shape.
+
+    Returns the path and the square of the other shape it touches.
+    """
+    size = len(grid)
+    shape_id = grid[start]
+    parents = {start: None}
+    queue = [start]
+    for i, j in queue:
+        for k in rng.permutation(len(NEIGHBOURS)):
+            di, dj = NEIGHBOURS[k]
+            coords = (i + di, j + dj)
+            if not (0 <= coords[0] < size and 0 <= coords[1] < size):
+                continue
+            if grid[coords] != shape_id:
+                path = [(i, j)]
+                while parents[path[-1]] is not None:
+                    path.append(parents[path[-1]])
+                return path, coords
+            if coords not in parents and coords not in fixed:
+                parents[coords] = (i, j)
+                queue.append(coords)
+    return None
+
+
+def connected_squares(grid: np.ndarray, start: tuple[int, int]) -> set[tuple[int, int]]:
+    """Return the squares of start's shape that can be reached from it."""
+    size = len(grid)
+    seen = {start}
+    stack = [start]
+    while stack:
+        i, j = stack.pop()
+        for di, dj in NEIGHBOURS:
+            coords = (i + di, j + dj)
+            if 0 <= coords[0] < size and 0 <= coords[1] < size and coords not in seen and grid[coords] == grid[start]:
+                seen.add(coords)
+                stack.append(coords)
+    return seen
+
+
+def grade_board(grid: np.ndarray) -> str:
+    """How much of the solver a board needs.
+
+    easy: the single square and blocking rules, medium: also the
+    row/col/shape matching rule, hard: a search.
+    """
+    board = Board(grid)
+    if propagation.propagate(board, RuleSet(stages=(CHEAP_RULES,), branches=tree_or_dash)) and board.is_full:
+        return "easy"
+    if propagate(board) and board.is_solved:
+        return "medium"
+    return "hard"
+
+
+def _generate_task(task: tuple[int, int, int]) -> tuple[int, int, np.ndarray, str]:
+    """Generate and grade one board in a worker process."""
+    seed, size, index = task
+    rng = np.random.default_rng([seed, size, index])
+    grid = generate_board(size, rng)
+    return size, index, grid, grade_board(grid)
+
+
+def generate_puzzles(sizes: list[int], count: int, seed: int = 0, processes: int | None = None) -> dict[str, int]:
+    """Generate count boards of each size and save them as csv.
+
+    Boards are saved to generated_tree_puzzles/<size>x<size>/<difficulty>/.
+    Returns the number of boards saved per difficulty.
+    """
+    tasks = [(seed, size, index) for size in sizes for index in range(count)]
+    saved = dict.fromkeys(DIFFICULTIES, 0)
+    with Pool(processes) as pool:
+        for size, index, grid, difficulty in pool.imap_unordered(_generate_task, tasks, chunksize=8):
+            folder = GENERATED_TREE_PUZZLES_PATH / f"{size}x{size}" / difficulty
+            folder.mkdir(parents=True, exist_ok=True)
+            save_grid_as_csv(grid, folder.relative_to(DOWNLOAD_BASE_PATH) / f"tree_{size}_{seed}_{index}.csv")
+            saved[difficulty] += 1
+    LOG.info(f"Saved {len(tasks)} boards to {GENERATED_TREE_PUZZLES_PATH}: {saved}")
+    return saved
+
+
+if __name__ == "__main__":
+    generate_puzzles(sizes=list(range(MIN_SIZE, MAX_SIZE + 1)), count=100)
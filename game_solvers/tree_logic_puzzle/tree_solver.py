@@ -5,6 +5,7 @@ Logic - ask mary
 3. If all of shape in one row/column then all other squares in that row/column are -        (done)
 5. If a row/col contains only 2 colours then the rest of these colours are - (extends to n=3, n=4 etc.)
 4. If 2 shapes exist only in 2 columns/rows then all others in those rows/columns are - (same as 3 but for n=2, n=3 etc)    (done)
+6. 4 and 5 for every n at once: match rows/cols to shapes, squares of a row/col + shape pair no matching uses are -    (done)
 
 
 Make a move
@@ -15,293 +16,306 @@ Add logger to explain the moves made (narration)
 - outlines of shapes
 """
 
-from board import read_board, Board
+from board import read_board, blocked_masks, touching_masks, Board
+from exact_cover_solver import solve_board_exact_cover
 import numpy as np
-from game_solvers.logger import LOG
-from itertools import combinations
+from game_solvers.matching import supported_edges
 from game_solvers.sporcle_parser import DOWNLOAD_BASE_PATH
-from pathlib import Path
-from copy import deepcopy
+from functools import cache
+from collections.abc import Callable, Iterable, Iterator
+from functools import partial
+from game_solvers import propagation
+from game_solvers.propagation import RuleSet
+from game_solvers.solver_stats import SolverStats
+from game_solvers.move_trace import MoveEvent, MoveTrace
 
 TREE_PUZZLES_PATH = DOWNLOAD_BASE_PATH / "tree_logic_puzzles"
-
-
-def solve_board(board: Board) -> bool:
-    """Main loop to solve the board."""
-    while board.is_live:
-        # We restart the loop if any of the rules causes a change
-        # Try to run cheap tests first
-        if is_only_one_square_available(board):
-            continue
-        if square_blocks_all(board):
-            continue
-
-        # Dont need to check the case where n = len(board)
-        for n in range(1, board.board_state.shape[0]):
-            if any_n_rows_cols_only_n_colours(board, n):
-                break
-            if n == 1:
-                continue
-            if any_n_shapes_exist_in_n_rows_cols(board, n):
-                break
-
+# Unit types as recorded in the move trace
+UNIT_TYPES = ("row", "col", "shape")
+# Moves the rules record in board.trace, the event ids follow
+TREE_MOVES = (
+    MoveEvent(
+        "only_squares_left",
+        lambda f: f"Tree at ({f[0]}, {f[1]}): {UNIT_TYPES[f[2]]} {f[3]} has only as many squares available as trees needed",
+    ),
+    MoveEvent("blocks_unit", lambda f: f"Dash at ({f[0]}, {f[1]}): a tree there would block {UNIT_TYPES[f[2]]} {f[3]}"),
+    MoveEvent("no_matching", lambda f: f"No arrangement of trees fills every {UNIT_TYPES[f[0]]} and shape. Dashes everywhere"),
+    MoveEvent(
+        "unmatchable",
+        lambda f: f"Dash at ({f[0]}, {f[1]}): no arrangement of trees puts the tree of its {UNIT_TYPES[f[2]]} in shape {f[3]}",
+    ),
+    MoveEvent("probe", lambda f: f"Attempting to place a tree at ({f[0]}, {f[1]})"),
+    MoveEvent("probe_solved", lambda f: f"Attempt to place a tree at ({f[0]}, {f[1]}) was successful"),
+    MoveEvent("probe_no_contradiction", lambda f: f"Tree at ({f[0]}, {f[1]}) gives no contradiction - trying next option"),
+    MoveEvent("contradiction", lambda f: f"Dash at ({f[0]}, {f[1]}): a tree there gives a contradiction"),
+)
+(
+    ONLY_SQUARES_LEFT, BLOCKS_UNIT, NO_MATCHING, UNMATCHABLE, PROBE, PROBE_SOLVED, PROBE_NO_CONTRADICTION, CONTRADICTION
+) = range(len(TREE_MOVES))
+
+
+def solve_board(
+    board: Board, mode: str = "rules", stats: SolverStats | None = None, trace: MoveTrace | None = None
+) -> bool:
+    """Main loop to solve the board.
+
+    mode: "rules" to apply the logic rules, "search" to branch on a tree or
+        dash when they stall, "exact_cover" to search with Algorithm X
+    stats: records every rule run on the board (also kept as board.stats)
+    trace: records every move of the rules (also kept as board.trace)
+    """
+    if stats is not None:
+        board.stats = stats
+    if trace is not None:
+        board.trace = trace
+    if mode == "exact_cover":
+        return solve_board_exact_cover(board)
+    elif mode == "search":
+        return propagation.search(board, TREE_RULES)
+    elif mode != "rules":
+        raise ValueError(f"mode {mode} is not recognised.")
+
+    while propagate(board) and board.is_live:
         # None of the strategies made progress
         # find a contradiction in one of the available options
-        if find_contradiction(board):
-            continue
-
-        else:
+        if not board.stats.timed("find_contradiction", find_contradiction, board):
             # No solution found
             return False
 
     return board.is_solved
 
 
-def is_only_one_square_available(board: Board) -> bool:
-    """Place a T if there is only one square available in a row, column or square."""
+def propagate(board: Board) -> bool:
+    """Apply the logic rules until none of them make progress.
 
-    def check_one_square_available(group_to_scan: np.ndarray | list) -> tuple:
-        """For any given group check whether only one square is available.
-
-        Here group is row/col/shape
-        """
-        available_idx = np.where([g.symbol_id == 0 for g in group_to_scan])[0]
-        if len(available_idx) != 1:
-            return tuple()
-        coords = group_to_scan[available_idx[0]].coords
-        board.place_tree(coords)
-        return coords
-
-    success_log_message = "Only one available spot found for {} number {} with coordinates {}. Placing a tree."
-    # row
-    for row_idx, row in enumerate(board.board_state):
-        res = check_one_square_available(row)
-        if res:
-            LOG.info(success_log_message.format("row", row_idx, str(res)))
-            return True
-
-    # col
-    for col_idx, col in enumerate(board.board_state.T):
-        res = check_one_square_available(col)
-        if res:
-            LOG.info(success_log_message.format("col", col_idx, str(res)))
-            return True
+    Returns whether the board is still valid.
+    """
+    return propagation.propagate(board, TREE_RULES)
 
-    # Shape
-    groups = board.get_groups()
-    for group_id, group_squares in groups.items():
-        res = check_one_square_available(group_squares)
-        if res:
-            LOG.info(success_log_message.format("shape", group_id, str(res)))
-            return True
 
-    return False
+def count_solutions(board: Board, limit: int = 2) -> int:
+    """Count the solutions of the board, stopping once limit are found.
 
+    Propagates the rules then branches on a square of the row, column or
+    shape with fewest available squares: a tree, then a dash. The board is
+    left as it was.
+    """
+    return propagation.count_solutions(board, TREE_RULES, limit)
 
-def square_blocks_all(board: Board) -> bool:
-    """If square being tree blocks all of another shape/row/col it is not a tree.
 
-    This is rule 2 but also does 3.
+def tree_or_dash(board: Board) -> list[Callable[[], None]]:
+    """Guesses for a square of the unit with fewest available squares: a tree, then a dash."""
+    coords = most_constrained_unit(board)[0]
+    return [partial(board.place_tree, coords), partial(board.place_dash, coords)]
 
-    Note: doesn't count if it blocks its own shape/col/row
-    """
-    empty_squares = board.get_empty_squares()
-    groups = board.get_groups()
 
-    for square in empty_squares:
-        blocked_squares = board.get_blocked_squares(square)
+def most_constrained_unit(board: Board) -> list[tuple[int, int]]:
+    """Return the available squares of the unit with fewest of them."""
+    options = [
+        [square.coords for square in board.get_unit_squares(unit) if square.symbol_id == 0]
+        for unit in board.get_units()
+    ]
+    return min((o for o in options if o), key=len)
 
-        for group_id, group in groups.items():
-            if square.shape_id == group_id:
-                # Don't check the square's own group
-                continue
-            # 2 is T
-            if any(s.symbol_id == 2 for s in group):
-                # This group is not blocked
-                continue
 
-            available_squares = [
-                s for s in group if s.symbol_id == 0 and s not in blocked_squares
-            ]
-            if not available_squares:
-                # Group has no available squares and has no T - SQUARE BLOCKS
-                board.place_dash(square.coords)
-                LOG.info(
-                    f"The square at {square.coords} would block shapes if it was a tree. Placing a dash"
-                )
-                return True
+def is_only_one_square_available(board: Board, units: set[tuple[str, int]] | None = None) -> bool:
+    """Place a T if there is only one square available in a row, column or square.
 
-        # rows
-        row_idx, col_idx = square.coords
-        for idx, row in enumerate(board.board_state):
-            if idx == row_idx:
-                continue
-            available_row = [s for s in row if s.symbol_id == 0]
-            if available_row and all(s in blocked_squares for s in available_row):
-                board.place_dash(square.coords)
-                LOG.info(
-                    f"Square at {square.coords} would block entire row {idx}. Placing a dash."
-                )
-                return True
+    With more trees per unit: place Ts if a unit has only as many squares
+    available as trees still needed.
+    Only the given units are checked (default all) and every one found is placed.
+    """
+    units = board.get_units() if units is None else sorted(units)
+    trace = board.trace
+
+    placed = False
+    for unit in units:
+        squares = board.get_unit_squares(unit)
+        available = [s for s in squares if s.symbol_id == 0]
+        # 2 is T
+        needed = board.trees_per_unit - sum(s.symbol_id == 2 for s in squares)
+        if not available or len(available) != needed:
+            continue
+        for square in available:
+            # Placing one tree can dash the others (leaving the unit invalid)
+            if square.symbol_id == 0:
+                board.place_tree(square.coords)
+                if trace is not None:
+                    trace.record(ONLY_SQUARES_LEFT, *square.coords, UNIT_TYPES.index(unit[0]), unit[1])
+        placed = True
 
-        # cols
-        for idx, col in enumerate(board.board_state.T):
-            if idx == col_idx:
-                continue
-            available_col = [s for s in col if s.symbol_id == 0]
-            if available_col and all(s in blocked_squares for s in available_col):
-                board.place_dash(square.coords)
-                LOG.info(
-                    f"Square at {square.coords} would block entire column {idx}. Placing a dash."
-                )
-                return True
-    return False
+    return placed
 
 
-def any_n_rows_cols_only_n_colours(board: Board, num_colours: int) -> bool:
-    """If a group of n rows/cols is made of the same n colours the rest of those n shapes are dashes.
+def square_blocks_all(board: Board, units: set[tuple[str, int]] | None = None) -> bool:
+    """If square being tree blocks all of another shape/row/col it is not a tree.
 
-    Note we only consider available squares.
+    This is rule 2 but also does 3.
+    Only the given units are checked (default all): a square can only start
+    blocking a unit once that unit's available squares change.
+    All empty squares are checked at once: for each unit, count the available
+    squares each square would leave unblocked.
+    With more trees per unit a square is blocked if it leaves fewer squares
+    than the unit still needs trees (one fewer for its own units).
+
+    Note: with one tree per unit, it never blocks its own shape/col/row
+    """
+    units = board.get_units() if units is None else sorted(units)
+    if not units:
+        return False
+    symbols = board.board_symbols().ravel()
+    empty = symbols == 0
+
+    unit_masks = np.array([board.get_unit_mask(unit) for unit in units])
+    available = unit_masks & empty
+    # 2 is T. Units with all their trees are not blocked
+    needed = board.trees_per_unit - (unit_masks & (symbols == 2)).sum(axis=1)
+    checked_units = available.any(axis=1) & (needed > 0)
+
+    unblocked_count = available.astype(np.float32) @ unblocked_weights(board.size, board.trees_per_unit)
+    blocks = (unblocked_count < needed[:, None] - unit_masks) & empty & checked_units[:, None]
+
+    trace = board.trace
+    blocking_squares = np.where(blocks.any(axis=0))[0]
+    for flat_idx in blocking_squares:
+        coords = tuple(int(c) for c in divmod(flat_idx, board.size))
+        board.place_dash(coords)
+        if trace is not None:
+            unit_type, unit_idx = units[np.argmax(blocks[:, flat_idx])]
+            trace.record(BLOCKS_UNIT, *coords, UNIT_TYPES.index(unit_type), unit_idx)
+    return len(blocking_squares) > 0
+
+
+@cache
+def unblocked_weights(size: int, trees_per_unit: int = 1) -> np.ndarray:
+    """1.0 where a square stays available if another square is a tree.
+
+    With one tree per unit a tree blocks its row, column and diagonals,
+    otherwise only itself and the squares touching it.
     """
+    if trees_per_unit == 1:
+        return (~blocked_masks(size)).astype(np.float32)
+    return (~touching_masks(size)).astype(np.float32)
 
-    def check_group_n_colours(
-        groups_to_scan: np.ndarray | list, num_colours: int
-    ) -> bool:
-        """For any given group check it is made up of the exactly <num_colours> colours.
-
-        The colours must be the same in each row
-        Here group is row/col
-        """
-        available_squares_per_group = {
-            i: [g for g in group if g.symbol_id == 0]
-            for i, group in enumerate(groups_to_scan)
-        }
-
-        if any(
-            len(available_squares) == 0
-            for available_squares in available_squares_per_group.values()
-        ):
-            # Nothing available, nothing to do here
-            return False
 
-        unique_shape_ids = {
-            i: set(s.shape_id for s in available_squares)
-            for i, available_squares in available_squares_per_group.items()
-        }
-
-        # Need to check each group has the same unique shape ids
-        # and length is equal to num_colours
-        first = unique_shape_ids[0]
-        if (
-            all(first == u for u in unique_shape_ids.values())
-            and len(first) == num_colours
-        ):
-            # We have a group with exactly <num_colours> shape_ids.
-            # All other values in these shapes must be dashes
-            shape_squares = {
-                square.coords
-                for i in first
-                for square in board.get_squares_of_shape(shape_id=i)
-                if square.symbol_id == 0
-            }
-            group_squares = {s.coords for group in groups_to_scan for s in group}
-            squares_to_update = shape_squares.difference(group_squares)
-
-            if not squares_to_update:
-                return False
-            for square_coords in squares_to_update:
-                board.place_dash(square_coords)
-            return True
+def row_col_shape_pair_unmatchable(board: Board, units: set[tuple[str, int]] | None = None) -> bool:
+    """Dash squares whose row/col + shape pair no arrangement of trees can use.
 
-    success_log_msg = "The squares in {} numbers {} only contain squares from {} shapes. The rest of the shapes are dashes."
+    Each row has exactly one tree and so does each shape, so the trees match
+    rows to shapes. A row is joined to a shape while it has an available
+    square of that shape. Pairs left out of every perfect matching can
+    never hold the tree. This finds every Hall set in polynomial time, so it
+    covers the old "n rows/cols only hold n colours" and "n shapes only
+    exist in n rows/cols" rules for every n. Then the same for columns.
 
-    for row_idxs in combinations(range(board.size), num_colours):
-        selected_rows = [board.board_state[i] for i in row_idxs]
-        res = check_group_n_colours(selected_rows, num_colours=num_colours)
-        if res:
-            LOG.info(success_log_msg.format("row", row_idxs, num_colours))
-            return True
+    With more trees per unit each row and shape appears once per tree it
+    still needs, so this only checks the counts (it ignores touching trees).
 
-    # cols
-    for col_idxs in combinations(range(board.size), num_colours):
-        selected_cols = [board.board_state[:, i] for i in col_idxs]
-        res = check_group_n_colours(selected_cols, num_colours=num_colours)
-        if res:
-            LOG.info(success_log_msg.format("col", col_idxs, num_colours))
+    If no perfect matching exists there is no solution, so every square is -.
+    Every unit is always checked, units is only taken to fit the rule interface.
+    """
+    shape_ids = board.board_shape_ids()
+    symbols = board.board_symbols()
+    shapes = [int(i) for i in np.unique(shape_ids)]
+    k = board.trees_per_unit
+
+    # One copy of each shape per tree it still needs. 2 is T
+    shape_copies = {
+        shape_id: range(start, start + needed)
+        for shape_id, start, needed in _copies(
+            shapes, [k - int((symbols[shape_ids == shape_id] == 2).sum()) for shape_id in shapes]
+        )
+    }
+    num_right = sum(len(copies) for copies in shape_copies.values())
+    trace = board.trace
+
+    updated = False
+    for label, shape_grid, symbol_grid, to_coords in (
+        ("row", shape_ids, symbols, lambda i, j: (i, j)),
+        ("col", shape_ids.T, symbols.T, lambda i, j: (j, i)),
+    ):
+        lines = range(len(shape_grid))
+        line_needed = [k - int((symbol_row == 2).sum()) for symbol_row in symbol_grid]
+        line_copies = {i: range(start, start + needed) for i, start, needed in _copies(lines, line_needed)}
+        # 0 is empty
+        adjacency = [
+            {right for shape_id in np.unique(shape_grid[i][symbol_grid[i] == 0]) for right in shape_copies[int(shape_id)]}
+            for i in lines
+            for _ in line_copies[i]
+        ]
+        supported = supported_edges(adjacency, num_right)
+
+        if supported is None:
+            if trace is not None:
+                trace.record(NO_MATCHING, UNIT_TYPES.index(label))
+            for square in board.get_empty_squares():
+                board.place_dash(square.coords)
             return True
-    return False
-
 
-def any_n_shapes_exist_in_n_rows_cols(board: Board, num_shapes: int) -> bool:
-    """If N shapes only exist in N rows/cols any other shapes in those columns is -
+        for i, (shape_row, symbol_row) in enumerate(zip(shape_grid, symbol_grid)):
+            if not line_copies[i]:
+                continue
+            # Copies are interchangeable so the first speaks for all of them
+            left = line_copies[i].start
+            unmatchable = [
+                shape_id for shape_id, copies in shape_copies.items()
+                if copies and copies.start in adjacency[left] and copies.start not in supported[left]
+            ]
+            squares_to_update = np.where(np.isin(shape_row, unmatchable) & (symbol_row == 0))[0]
+            if not len(squares_to_update):
+                continue
+            for j in squares_to_update:
+                board.place_dash(to_coords(i, int(j)))
+                if trace is not None:
+                    trace.record(UNMATCHABLE, *to_coords(i, int(j)), UNIT_TYPES.index(label), shape_row[j])
+            updated = True
+    return updated
 
-    Note we only consider available squares.
-    Don't need to consider n=1
-    """
 
-    def check_colour_n_groups(shape_squares: list) -> set:
-        """For any N shapes if they are only in N rows/cols the rest of the row/col must be -"""
-        squares = [item for sublist in shape_squares for item in sublist]
-        row_idxs = list(
-            set(square.coords[0] for square in squares)
-        )  # list needed for indexing
-        if len(row_idxs) == len(shape_squares):
-            selected_rows = board.board_state[row_idxs, :].flatten()
-            coords_to_update = [s.coords for s in selected_rows if s not in squares]
-            for coord in coords_to_update:
-                board.place_dash(coord)
-            return row_idxs, "rows"
-
-        col_idxs = list(
-            set(square.coords[1] for square in squares)
-        )  # list needed for indexing
-        if len(col_idxs) == len(shape_squares):
-            selected_cols = board.board_state[:, col_idxs].flatten()
-            coords_to_update = [s.coords for s in selected_cols if s not in squares]
-            for coord in coords_to_update:
-                board.place_dash(coord)
-            return col_idxs, "columns"
-        return set(), None
-
-    for shapes in combinations(board.get_groups().items(), num_shapes):
-        shape_idx, shape_squares = zip(*[shapes[i] for i in range(num_shapes)])
-        group_idx, group_type = check_colour_n_groups(shape_squares)
-        if group_idx:
-            LOG.info(
-                f"Shapes {shape_idx} exist only in {group_type} {group_idx} all other squares in these {group_type} are dashes."
-            )
-            return True
-    return False
+def _copies(items: Iterable, counts: list[int]) -> Iterator[tuple]:
+    """Yield (item, first index, count) numbering count copies of each item in turn."""
+    start = 0
+    for item, count in zip(items, counts):
+        count = max(count, 0)
+        yield item, start, count
+        start += count
 
 
 def find_contradiction(board: Board) -> bool:
     """Attempt to locate a contradiction by recursively solving
 
-    Try the groups with smallest number of possibilities first
+    Try the groups with smallest number of possibilities first.
+    Each attempt is undone with the board trail rather than a copy.
+    Each square tried counts as a probe in board.stats.
     """
+    trace = board.trace
     sorted_possibilities = get_sorted_possibilities(board)
     for p in sorted_possibilities:
         for square in p:
-            board_copy = deepcopy(board)
-            board_copy.place_tree(square.coords)
-            LOG.info(f"Attempting to place a tree at {square.coords}")
+            board.stats.add_work("find_contradiction", 1)
+            checkpoint = board.checkpoint()
+            board.place_tree(square.coords)
+            if trace is not None:
+                trace.record(PROBE, *square.coords)
             # Check contradiction
-            solved_copy = solve_board(board_copy)
+            solved = solve_board(board)
 
-            if solved_copy:
-                LOG.info(f"Attempt to place a tree at {square.coords} was successful")
-                # Replace the original with the solved version
-                board.set_board_state(board_copy.board_state)
+            if solved:
+                if trace is not None:
+                    trace.record(PROBE_SOLVED, *square.coords)
                 return True
 
             else:
-                LOG.info(f"Attempt to place a tree at {square.coords} was unsuccessful")
-                if board_copy.is_valid():
+                is_valid = board.is_valid()
+                board.rollback(checkpoint)
+                if is_valid:
                     # Can't say anything - no evidence. Try the next
-                    LOG.info("No contradiction - trying next option")
+                    if trace is not None:
+                        trace.record(PROBE_NO_CONTRADICTION, *square.coords)
                     continue
-                LOG.info("Contradiction - place a -")
                 board.place_dash(square.coords)
+                if trace is not None:
+                    trace.record(CONTRADICTION, *square.coords)
                 return True
 
 
@@ -328,6 +342,12 @@ def get_sorted_possibilities(board: Board) -> list[list]:
     return sorted(possibilities, key=lambda x: len(x))
 
 
+# Cheap rules only rescan the rows/cols/shapes changed since their last pass.
+# The matching rule covers the n rows/cols and n shapes rules for every n in one pass
+CHEAP_RULES = (is_only_one_square_available, square_blocks_all)
+TREE_RULES = RuleSet(stages=(CHEAP_RULES, (row_col_shape_pair_unmatchable,)), branches=tree_or_dash)
+
+
 # TODO: add selection of data sample
 # TODO: add logging of how we solved
 # TODO: add tests
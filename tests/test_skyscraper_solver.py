@@ -0,0 +1,88 @@
+"""Skyscraper solver tests against a brute force search of every latin square."""
+import sys
+from itertools import permutations
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# The skyscraper modules use sibling imports, and the tree folder has its own board module
+sys.path.insert(0, str(Path(__file__).parents[1] / "game_solvers" / "skyscraper_logic_puzzle"))
+sys.modules.pop("board", None)
+from board import Board  # noqa: E402
+from skyscraper_solver import count_solutions, solve_board  # noqa: E402
+
+
+def visible_score(line, variant: str) -> int:
+    score = highest = 0
+    for height in line:
+        if height > highest:
+            score += 1 if variant == "count" else int(height)
+            highest = height
+    return score
+
+
+def clue_rows(square: np.ndarray, variant: str) -> np.ndarray:
+    """Clues in the csv order: from the top, left, right and bottom."""
+    return np.array([
+        [visible_score(col, variant) for col in square.T],
+        [visible_score(row, variant) for row in square],
+        [visible_score(row[::-1], variant) for row in square],
+        [visible_score(col[::-1], variant) for col in square.T],
+    ])
+
+
+def latin_squares(size: int):
+    """Yield every latin square of the values 1..size."""
+    rows = list(permutations(range(1, size + 1)))
+
+    def place(square: list[tuple[int, ...]]):
+        if len(square) == size:
+            yield np.array(square)
+            return
+        for row in rows:
+            if all(row[j] != other[j] for other in square for j in range(size)):
+                yield from place(square + [row])
+
+    yield from place([])
+
+
+def brute_force_solutions(grid: np.ndarray, variant: str) -> list[np.ndarray]:
+    """The latin squares meeting every clue and given square of a puzzle."""
+    clues, givens = grid[:4], grid[4:]
+    size = len(givens)
+    return [
+        square for square in latin_squares(size)
+        if ((givens == 0) | (givens == square)).all() and ((clues == 0) | (clues == clue_rows(square, variant))).all()
+    ]
+
+
+@pytest.mark.parametrize("variant", ["count", "sum"])
+def test_count_solutions_matches_brute_force(variant):
+    rng = np.random.default_rng(4)
+    squares = list(latin_squares(4))
+    for _ in range(20):
+        square = squares[rng.integers(len(squares))]
+        # Keep a random few clues and given squares, so some puzzles have many solutions
+        grid = np.vstack([clue_rows(square, variant), square])
+        grid[rng.random(grid.shape) < rng.uniform(0.5, 0.95)] = 0
+        solutions = brute_force_solutions(grid, variant)
+
+        board = Board(grid, Path("test.csv"), variant)
+        assert count_solutions(board, limit=1000) == len(solutions)
+        assert count_solutions(board, limit=1) == 1
+        # Counting leaves the board as it was
+        assert (board.board_values() == grid[4:]).all()
+
+        assert solve_board(board, mode="search")
+        assert any((board.board_values() == solution).all() for solution in solutions)
+
+
+def test_rules_mode_checks_every_clue():
+    # The rules fill this board, but row 3 starts with a 3 when its left clue of 1 needs a 4
+    grid = np.array([[1, 2, 2, 0], [0, 3, 0, 1], [4, 0, 0, 0], [2, 0, 3, 2]] + [[0] * 4] * 4)
+    assert brute_force_solutions(grid, "count") == []
+
+    board = Board(grid, Path("test.csv"))
+    assert not solve_board(board)
+    assert board.is_full
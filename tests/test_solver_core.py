@@ -0,0 +1,151 @@
+"""Unit tests for the pieces the solvers are built on."""
+import sys
+from itertools import islice, permutations
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from game_solvers.exact_cover import exact_covers
+from game_solvers.matching import supported_edges
+from game_solvers.propagation import SearchBudgetExceeded, Trail
+
+# The skyscraper modules use sibling imports, and the tree folder has its own board module
+sys.path.insert(0, str(Path(__file__).parents[1] / "game_solvers" / "skyscraper_logic_puzzle"))
+sys.modules.pop("board", None)
+from line_tables import build_line_table, fit_lines  # noqa: E402
+from skyscraper_solver import attempt_to_fit_buildings  # noqa: E402
+
+
+def brute_force_edges(adjacency: list[set[int]], num_right: int) -> list[set[int]] | None:
+    """Edges used by some perfect matching, by trying every assignment."""
+    edges = [set() for _ in adjacency]
+    for rights in permutations(range(num_right), len(adjacency)):
+        if all(right in adjacency[left] for left, right in enumerate(rights)):
+            for left, right in enumerate(rights):
+                edges[left].add(right)
+    return edges if any(edges) else None
+
+
+def test_supported_edges_drops_edges_no_perfect_matching_uses():
+    # Left 0 and 1 can only use 0 and 1, so 2 is left 2's only option
+    adjacency = [{0, 1}, {0, 1}, {0, 1, 2}]
+    assert supported_edges(adjacency, 3) == [{0, 1}, {0, 1}, {2}]
+
+
+def test_supported_edges_without_perfect_matching():
+    assert supported_edges([{0}, {0}], 2) is None
+    assert supported_edges([{0, 1}], 2) is None
+
+
+def test_supported_edges_matches_brute_force():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        size = int(rng.integers(1, 6))
+        adjacency = [set(np.flatnonzero(rng.random(size) < 0.5).tolist()) for _ in range(size)]
+        assert supported_edges(adjacency, size) == brute_force_edges(adjacency, size)
+
+
+def test_exact_covers_finds_every_cover():
+    # Only rows a, d and e cover each column once
+    rows = {
+        "a": [3, 5, 6],
+        "b": [1, 4, 7],
+        "c": [2, 3, 6],
+        "d": [1, 4],
+        "e": [2, 7],
+        "f": [4, 5, 7],
+    }
+    covers = [sorted(cover) for cover in exact_covers(rows, set(range(1, 8)))]
+    assert covers == [["a", "d", "e"]]
+
+
+def test_exact_covers_secondary_columns_and_selected_rows():
+    # x is secondary: covered at most once
+    rows = {"a": [1, "x"], "b": [2, "x"], "c": [1], "d": [2]}
+    covers = sorted(sorted(cover) for cover in exact_covers(rows, {1, 2}))
+    assert covers == [["a", "d"], ["b", "c"], ["c", "d"]]
+    assert sorted(sorted(cover) for cover in exact_covers(rows, {1, 2}, selected=["a"])) == [["a", "d"]]
+    assert list(exact_covers(rows, {1, 2}, selected=["a", "b"])) == []
+
+
+def test_exact_covers_budget():
+    rows = {(i, j): [("row", i), ("col", j)] for i in range(6) for j in range(6)}
+    primary = {("row", i) for i in range(6)} | {("col", j) for j in range(6)}
+    assert len(list(islice(exact_covers(rows, primary), 10))) == 10
+    with pytest.raises(SearchBudgetExceeded):
+        list(exact_covers(rows, primary, max_nodes=100))
+
+
+def test_trail_rollback_undoes_newest_first():
+    state = {}
+    undone = []
+
+    def undo(entry):
+        key, old = entry
+        undone.append(key)
+        state[key] = old
+
+    trail = Trail(undo)
+    state["a"] = 1
+    trail.push(("a", 0))
+    checkpoint = trail.checkpoint()
+    state["b"] = 2
+    trail.push(("b", 0))
+    state["a"] = 3
+    trail.push(("a", 1))
+
+    trail.rollback(checkpoint)
+    assert state == {"a": 1, "b": 0}
+    assert undone == ["a", "b"]
+    assert trail.checkpoint() == checkpoint
+
+    trail.rollback(0)
+    assert state == {"a": 0, "b": 0}
+    trail.rollback(0)
+    assert undone == ["a", "b", "a"]
+
+
+def visible_score(line: tuple[int, ...], variant: str) -> int:
+    score = highest = 0
+    for height in line:
+        if height > highest:
+            score += 1 if variant == "count" else height
+            highest = height
+    return score
+
+
+def brute_force_fit(candidates: np.ndarray, rule: int, opposite_rule: int, variant: str) -> np.ndarray:
+    """Candidates of each square used by some permutation that fits, by trying them all."""
+    options = np.zeros_like(candidates)
+    for line in permutations(range(1, len(candidates) + 1)):
+        if rule and visible_score(line, variant) != rule:
+            continue
+        if opposite_rule and visible_score(line[::-1], variant) != opposite_rule:
+            continue
+        masks = [1 << (value - 1) for value in line]
+        if all(candidates[i] & mask for i, mask in enumerate(masks)):
+            options |= np.array(masks, dtype=candidates.dtype)
+    return options
+
+
+@pytest.mark.parametrize("variant", ["count", "sum"])
+@pytest.mark.parametrize("size", [4, 5, 6])
+def test_line_fitting_matches_brute_force(size, variant):
+    rng = np.random.default_rng(size)
+    table = build_line_table(size, variant)
+    for attempt in range(40):
+        # Clues of a random line, which usually stays a candidate so some lines fit
+        line = tuple(int(value) for value in rng.permutation(size) + 1)
+        rule, opposite_rule = visible_score(line, variant), visible_score(line[::-1], variant)
+        if attempt % 4 == 1:
+            rule = 0
+        elif attempt % 4 == 2:
+            opposite_rule = 0
+        candidates = rng.integers(0, 1 << size, size).astype(np.uint32)
+        if attempt % 5:
+            candidates |= np.array([1 << (value - 1) for value in line], dtype=np.uint32)
+
+        expected = brute_force_fit(candidates, rule, opposite_rule, variant)
+        np.testing.assert_array_equal(fit_lines(table.select(rule, opposite_rule), candidates), expected)
+        np.testing.assert_array_equal(attempt_to_fit_buildings(candidates, rule, opposite_rule, variant), expected)
@@ -0,0 +1,124 @@
+"""Tree solver tests against a brute force search of every tree placement."""
+import sys
+from collections import Counter
+from copy import deepcopy
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# The tree modules use sibling imports, and the skyscraper folder has its own board module
+sys.path.insert(0, str(Path(__file__).parents[1] / "game_solvers" / "tree_logic_puzzle"))
+sys.modules.pop("board", None)
+from board import Board  # noqa: E402
+from tree_solver import count_solutions, solve_board  # noqa: E402
+
+NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+def tree_placements(size: int, trees_per_unit: int, shape_ids: np.ndarray | None = None, rng=None):
+    """Yield every placement of the trees, row by row, in a random order if rng is given.
+
+    Only rows, columns, touching trees and (with shape_ids) shapes are checked.
+    """
+    row_options = [
+        cols for cols in combinations(range(size), trees_per_unit) if all(b - a > 1 for a, b in zip(cols, cols[1:]))
+    ]
+
+    def place(row: int, trees: list[tuple[int, int]], col_counts: Counter, shape_counts: Counter):
+        if row == size:
+            if all(col_counts[j] == trees_per_unit for j in range(size)):
+                yield list(trees)
+            return
+        order = rng.permutation(len(row_options)) if rng is not None else range(len(row_options))
+        for option in order:
+            cols = row_options[option]
+            new_trees = [(row, col) for col in cols]
+            if any(i == row - 1 and abs(j - col) <= 1 for i, j in trees[-trees_per_unit:] for col in cols):
+                continue
+            new_cols = col_counts + Counter(cols)
+            new_shapes = shape_counts + Counter(int(shape_ids[t]) for t in new_trees) if shape_ids is not None else shape_counts
+            if max(new_cols.values()) > trees_per_unit or (new_shapes and max(new_shapes.values()) > trees_per_unit):
+                continue
+            yield from place(row + 1, trees + new_trees, new_cols, new_shapes)
+
+    yield from place(0, [], Counter(), Counter())
+
+
+def planted_grid(size: int, trees_per_unit: int, rng: np.random.Generator) -> tuple[np.ndarray, list[tuple[int, int]]]:
+    """Random shape ids with a solution planted: each shape grows out from trees_per_unit trees."""
+    trees = next(tree_placements(size, trees_per_unit, rng=rng))
+    shape_ids = np.full((size, size), -1)
+    for tree_idx, coords in enumerate(rng.permutation(trees)):
+        shape_ids[tuple(coords)] = tree_idx // trees_per_unit
+    while (shape_ids == -1).any():
+        i, j = rng.integers(size, size=2)
+        di, dj = NEIGHBOURS[rng.integers(4)]
+        if shape_ids[i, j] != -1 and 0 <= i + di < size and 0 <= j + dj < size and shape_ids[i + di, j + dj] == -1:
+            shape_ids[i + di, j + dj] = shape_ids[i, j]
+    return shape_ids, trees
+
+
+def board_trees(board: Board) -> set[tuple[int, int]]:
+    # 2 is T
+    return {(int(i), int(j)) for i, j in zip(*np.where(board.board_symbols() == 2))}
+
+
+@pytest.mark.parametrize("size, trees_per_unit", [(6, 1), (8, 1), (8, 2)])
+def test_solver_matches_brute_force(size, trees_per_unit):
+    rng = np.random.default_rng(size * trees_per_unit)
+    for _ in range(8):
+        shape_ids, trees = planted_grid(size, trees_per_unit, rng)
+        solutions = [set(solution) for solution in tree_placements(size, trees_per_unit, shape_ids)]
+        assert set(trees) in solutions
+
+        board = Board(shape_ids, trees_per_unit)
+        assert count_solutions(board, limit=1000) == len(solutions)
+        assert count_solutions(board, limit=1) == 1
+        # Counting leaves the board as it was
+        assert board.empty_count == size * size
+
+        assert solve_board(board, mode="search")
+        assert board_trees(board) in solutions
+
+        board = Board(shape_ids, trees_per_unit)
+        if solve_board(board):
+            assert board_trees(board) in solutions
+
+
+def test_rollback_restores_unit_counters():
+    rng = np.random.default_rng(0)
+    shape_ids, trees = planted_grid(8, 1, rng)
+    board = Board(shape_ids)
+
+    def counters() -> tuple:
+        return (
+            list(board.tree_counts), list(board.open_counts), board.invalid_count, board.empty_count,
+            board.board_symbols().tolist(),
+        )
+
+    def recounted() -> tuple:
+        other = Board(shape_ids)
+        other.set_board_state(deepcopy(board.board_state))
+        return (
+            list(other.tree_counts), list(other.open_counts), other.invalid_count, other.empty_count,
+            other.board_symbols().tolist(),
+        )
+
+    start = counters()
+    board.place_tree(trees[0])
+    checkpoint = board.checkpoint()
+    middle = counters()
+    assert middle == recounted()
+
+    # A second tree in the same row breaks the board
+    board.place_tree((trees[0][0], (trees[0][1] + 2) % 8))
+    assert not board.is_valid()
+    assert counters() == recounted()
+
+    board.rollback(checkpoint)
+    assert counters() == middle
+    assert board.is_valid()
+    board.rollback(0)
+    assert counters() == start